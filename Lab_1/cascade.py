@@ -0,0 +1,112 @@
+import numpy
+
+
+# fractional cascading over the tree of chains probed by the binary search:
+# node (low, high) probes chain (low + high) // 2, its children are (low, mid) and (mid, high)
+class Cascade:
+    def __init__(self, chain_offsets, chain_breaks):
+        self.chain_offsets = chain_offsets
+        self.node_mid = []
+        self.node_left = []
+        self.node_right = []
+
+        self.__build_nodes(len(chain_offsets) - 2)
+        self.__build_catalogs(chain_breaks)
+
+    def __build_nodes(self, last):
+        intervals = [(0, last)] if last > 1 else []
+        i = 0
+
+        while i < len(intervals):
+            low, high = intervals[i]
+            mid = (low + high) // 2
+            self.node_mid.append(mid)
+
+            for child_low, child_high, children in [(low, mid, self.node_left), (mid, high, self.node_right)]:
+                if child_high - child_low > 1:
+                    children.append(len(intervals))
+                    intervals.append((child_low, child_high))
+                else:
+                    children.append(-1)
+
+            i += 1
+
+        self.node_mid = numpy.array(self.node_mid, dtype=numpy.int64)
+        self.node_left = numpy.array(self.node_left, dtype=numpy.int64)
+        self.node_right = numpy.array(self.node_right, dtype=numpy.int64)
+
+    def __build_catalogs(self, chain_breaks):
+        nodes_count = len(self.node_mid)
+        catalogs = [None] * nodes_count
+        own_positions = [None] * nodes_count
+        left_bridges = [None] * nodes_count
+        right_bridges = [None] * nodes_count
+
+        # children always have greater numbers than their parent
+        for node in range(nodes_count - 1, -1, -1):
+            mid = self.node_mid[node]
+            own = chain_breaks[self.chain_offsets[mid]:self.chain_offsets[mid + 1]]
+            children = [self.node_left[node], self.node_right[node]]
+
+            # chains keep only their own edges, so the catalogs end with a sentinel
+            catalog = numpy.sort(
+                numpy.concatenate(
+                    [own, [numpy.inf]] + [catalogs[child][1::2] for child in children if child != -1]
+                ),
+                kind="stable"
+            )
+
+            catalogs[node] = catalog
+            own_positions[node] = numpy.searchsorted(own, catalog)
+            left_bridges[node] = Cascade.__bridges(catalogs, self.node_left[node], catalog)
+            right_bridges[node] = Cascade.__bridges(catalogs, self.node_right[node], catalog)
+
+        self.node_offsets = numpy.zeros(nodes_count + 1, dtype=numpy.int64)
+        self.node_offsets[1:] = numpy.cumsum([len(catalog) for catalog in catalogs])
+
+        self.values = Cascade.__concatenate(catalogs, numpy.float64)
+        self.own_positions = Cascade.__concatenate(own_positions, numpy.int64)
+        self.left_bridges = Cascade.__concatenate(left_bridges, numpy.int64) \
+            + numpy.repeat(self.node_offsets[numpy.maximum(self.node_left, 0)], numpy.diff(self.node_offsets))
+        self.right_bridges = Cascade.__concatenate(right_bridges, numpy.int64) \
+            + numpy.repeat(self.node_offsets[numpy.maximum(self.node_right, 0)], numpy.diff(self.node_offsets))
+
+    def start(self, ys):
+        nodes = numpy.zeros(len(ys), dtype=numpy.int64)
+
+        if len(self.node_mid) == 0:
+            return nodes, nodes.copy()
+
+        return nodes, numpy.searchsorted(self.values[:self.node_offsets[1]], ys)
+
+    # slots of the probed chains (in the flattened chain edges) for the given search states
+    def slots(self, nodes, positions):
+        return self.chain_offsets[self.node_mid[nodes]] + self.own_positions[positions]
+
+    def advance(self, nodes, positions, ys, dirs):
+        go_right = dirs == 1
+        children = numpy.where(go_right, self.node_right[nodes], self.node_left[nodes])
+        positions = numpy.where(go_right, self.right_bridges[positions], self.left_bridges[positions])
+
+        # every other element of a child catalog is copied into its parent,
+        # so the bridge overshoots the first element >= y by at most one position
+        starts = self.node_offsets[numpy.maximum(children, 0)]
+        back = (children != -1) & (positions > starts)
+        back[back] = self.values[positions[back] - 1] >= ys[back]
+        positions[back] -= 1
+
+        return children, positions
+
+    @staticmethod
+    def __bridges(catalogs, child, catalog):
+        if child == -1:
+            return numpy.zeros(len(catalog), dtype=numpy.int64)
+
+        return numpy.searchsorted(catalogs[child], catalog)
+
+    @staticmethod
+    def __concatenate(arrays, dtype):
+        if len(arrays) == 0:
+            return numpy.zeros(0, dtype=dtype)
+
+        return numpy.concatenate(arrays).astype(dtype, copy=False)
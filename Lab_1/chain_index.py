@@ -0,0 +1,363 @@
+import mmap
+import struct
+import zlib
+import numpy
+from cascade import Cascade
+
+
+# chains stored as a separator tree: an edge shared by chains first_chain .. first_chain + weight - 1
+# is kept only once, in the chain of that range which the binary search over chains probes first
+class ChainIndex:
+    OUTSIDE = -1
+
+    MAGIC = b"CHAINIDX"
+    FORMAT_VERSION = 3
+    HEADER_PREFIX = struct.Struct("<8sII")
+    FIELDS = [
+        ("start_x", numpy.float64),
+        ("start_y", numpy.float64),
+        ("end_x", numpy.float64),
+        ("end_y", numpy.float64),
+        ("weights", numpy.int64),
+        ("first_chain", numpy.int64),
+        ("chain_offsets", numpy.int64),
+        ("chain_edges", numpy.int64),
+        ("chain_breaks", numpy.float64)
+    ]
+
+    def __init__(self, start_x, start_y, end_x, end_y, weights, first_chain, chain_offsets, chain_edges,
+                 chain_breaks):
+        self.start_x = start_x
+        self.start_y = start_y
+        self.end_x = end_x
+        self.end_y = end_y
+        self.weights = weights
+        self.first_chain = first_chain
+        self.chain_offsets = chain_offsets
+        self.chain_edges = chain_edges
+        self.chain_breaks = chain_breaks
+        self.cascade = None
+
+    @staticmethod
+    def from_edges(start_x, start_y, end_x, end_y, weights, first_chain):
+        chains_count = int((first_chain + weights).max(initial=0))
+        last_chain = first_chain + weights - 1
+
+        probed = ChainIndex.first_probed(first_chain, last_chain, chains_count)
+        owners = numpy.where(
+            first_chain == 0,
+            0,
+            numpy.where(last_chain == chains_count - 1, chains_count - 1, probed)
+        )
+
+        chain_edges = numpy.lexsort((start_y, owners))
+        chain_offsets = numpy.zeros(chains_count + 1, dtype=numpy.int64)
+        chain_offsets[1:] = numpy.cumsum(numpy.bincount(owners, minlength=chains_count))
+
+        return ChainIndex(
+            start_x,
+            start_y,
+            end_x,
+            end_y,
+            weights,
+            first_chain,
+            chain_offsets,
+            chain_edges,
+            end_y[chain_edges]
+        )
+
+    # the first chain of [first, last] probed by the binary search over chains (without its
+    # initial probes of the first and the last chain), -1 if the search does not hit the range
+    @staticmethod
+    def first_probed(first, last, chains_count):
+        low = numpy.zeros(len(first), dtype=numpy.int64)
+        high = numpy.full(len(first), chains_count - 1, dtype=numpy.int64)
+        result = numpy.full(len(first), -1, dtype=numpy.int64)
+
+        while True:
+            sel = numpy.flatnonzero((result == -1) & (high - low > 1))
+
+            if len(sel) == 0:
+                break
+
+            mid = (low[sel] + high[sel]) // 2
+            hit = (first[sel] <= mid) & (mid <= last[sel])
+
+            result[sel[hit]] = mid[hit]
+            low[sel] = numpy.where(mid < first[sel], mid, low[sel])
+            high[sel] = numpy.where(mid > last[sel], mid, high[sel])
+
+        return result
+
+    def save(self, path):
+        header, arrays = self.pack()
+
+        with open(path, "wb") as file:
+            file.write(header)
+
+            for array in arrays:
+                file.write(array)
+
+    # header and arrays laid out one after another as 'from_buffer' reads them
+    def pack(self):
+        arrays = [
+            numpy.ascontiguousarray(getattr(self, name), dtype=dtype)
+            for name, dtype in ChainIndex.FIELDS
+        ]
+
+        checksum = 0
+
+        for array in arrays:
+            checksum = zlib.crc32(array, checksum)
+
+        return ChainIndex.__header(arrays, checksum), arrays
+
+    @staticmethod
+    def load(path, verify=True):
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return ChainIndex.from_buffer(buffer, verify)
+
+    @staticmethod
+    def from_buffer(buffer, verify=True):
+        prefix = ChainIndex.HEADER_PREFIX
+
+        if len(buffer) < prefix.size:
+            raise ValueError("Chain index is truncated")
+
+        magic, version, fields_count = prefix.unpack_from(buffer, 0)
+
+        if magic != ChainIndex.MAGIC:
+            raise ValueError("Not a chain index")
+
+        if version != ChainIndex.FORMAT_VERSION or fields_count != len(ChainIndex.FIELDS):
+            raise ValueError(
+                f"Unsupported chain index version {version}, "
+                f"expected {ChainIndex.FORMAT_VERSION}"
+            )
+
+        lengths_format = struct.Struct(f"<{fields_count}QI")
+
+        if len(buffer) < prefix.size + lengths_format.size:
+            raise ValueError("Chain index is truncated")
+
+        *lengths, checksum = lengths_format.unpack_from(buffer, prefix.size)
+        offset = ChainIndex.__align(prefix.size + lengths_format.size)
+
+        arrays = []
+        data_start = offset
+
+        for (_, dtype), length in zip(ChainIndex.FIELDS, lengths):
+            size = length * numpy.dtype(dtype).itemsize
+
+            if offset + size > len(buffer):
+                raise ValueError("Chain index is truncated")
+
+            arrays.append(numpy.frombuffer(buffer, dtype=dtype, count=length, offset=offset))
+            offset += size
+
+        if verify and zlib.crc32(memoryview(buffer)[data_start:offset]) != checksum:
+            raise ValueError("Chain index checksum mismatch")
+
+        return ChainIndex(*arrays)
+
+    @staticmethod
+    def __header(arrays, checksum):
+        header = ChainIndex.HEADER_PREFIX.pack(
+            ChainIndex.MAGIC,
+            ChainIndex.FORMAT_VERSION,
+            len(arrays)
+        )
+        header += struct.pack(f"<{len(arrays)}QI", *(len(array) for array in arrays), checksum)
+
+        return header.ljust(ChainIndex.__align(len(header)), b"\0")
+
+    @staticmethod
+    def __align(size):
+        return (size + 7) // 8 * 8
+
+    def build_cascade(self):
+        self.cascade = Cascade(self.chain_offsets, self.chain_breaks)
+
+    def chains_count(self):
+        return len(self.chain_offsets) - 1
+
+    def locate_many(self, points):
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        xs = points[:, 0]
+        ys = points[:, 1]
+
+        result = numpy.full((len(points), 2), ChainIndex.OUTSIDE, dtype=numpy.int64)
+        last = self.chains_count() - 1
+
+        if last < 0:
+            return result
+
+        # the first chain keeps all of its edges
+        y_min = self.start_y[self.chain_edges[0]]
+        y_max = self.chain_breaks[self.chain_offsets[1] - 1]
+        idx = numpy.flatnonzero((ys >= y_min) & (ys <= y_max))
+        xs = xs[idx]
+        ys = ys[idx]
+
+        first_edges, _ = self.__own_edges(ys, numpy.zeros(len(idx), dtype=numpy.int64))
+        first_dirs = self.__edge_directions(first_edges, xs, ys)
+
+        # edges of the last chain that are not kept in it are shared with the first one
+        last_edges, is_own = self.__own_edges(ys, numpy.full(len(idx), last, dtype=numpy.int64))
+        last_edges = numpy.where(is_own, last_edges, first_edges)
+        last_dirs = self.__edge_directions(last_edges, xs, ys)
+
+        inside = (first_dirs != -1) & (last_dirs != 1)
+        idx, xs, ys = idx[inside], xs[inside], ys[inside]
+        low_edges, low_dirs = first_edges[inside], first_dirs[inside]
+        high_edges, high_dirs = last_edges[inside], last_dirs[inside]
+
+        low = numpy.zeros(len(idx), dtype=numpy.int64)
+        high = numpy.full(len(idx), last, dtype=numpy.int64)
+        pending = numpy.ones(len(idx), dtype=bool)
+
+        if self.cascade is not None:
+            nodes, positions = self.cascade.start(ys)
+
+        while True:
+            sel = numpy.flatnonzero(pending & (high - low > 1))
+
+            if len(sel) == 0:
+                break
+
+            mid = (low[sel] + high[sel]) // 2
+
+            if self.cascade is None:
+                edges, is_own = self.__own_edges(ys[sel], mid)
+            else:
+                slots = self.cascade.slots(nodes[sel], positions[sel])
+                edges, is_own = self.__own_edges_at(slots, ys[sel], mid)
+
+            # an edge of the probed chain that is not kept in it is kept in an already probed chain,
+            # it is shared either with the chain 'low' or with the chain 'high'
+            shared_low = ~is_own & (mid <= self.first_chain[low_edges[sel]] + self.weights[low_edges[sel]] - 1)
+            shared_high = ~is_own & ~shared_low
+
+            dirs = numpy.empty(len(sel), dtype=numpy.int64)
+            dirs[is_own] = self.__edge_directions(edges[is_own], xs[sel[is_own]], ys[sel[is_own]])
+            dirs[shared_low] = low_dirs[sel[shared_low]]
+            dirs[shared_high] = high_dirs[sel[shared_high]]
+            edges = numpy.where(shared_low, low_edges[sel], numpy.where(shared_high, high_edges[sel], edges))
+
+            if self.cascade is not None:
+                nodes[sel], positions[sel] = self.cascade.advance(nodes[sel], positions[sel], ys[sel], dirs)
+
+            on_chain = dirs == 0
+            result[idx[sel[on_chain]]] = mid[on_chain, None]
+            pending[sel[on_chain]] = False
+
+            go_right = dirs == 1
+            go_left = dirs == -1
+            low[sel[go_right]] = mid[go_right]
+            low_edges[sel[go_right]] = edges[go_right]
+            low_dirs[sel[go_right]] = 1
+            high[sel[go_left]] = mid[go_left]
+            high_edges[sel[go_left]] = edges[go_left]
+            high_dirs[sel[go_left]] = -1
+
+        on_low = pending & (low == 0) & (low_dirs == 0)
+        on_high = pending & ~on_low & (high == last) & (high_dirs == 0)
+        between = pending & ~on_low & ~on_high
+
+        result[idx[on_low]] = 0
+        result[idx[on_high]] = last
+        result[idx[between], 0] = low[between]
+        result[idx[between], 1] = high[between]
+
+        return result
+
+    # edge of the chain containing y, it's kept in one of the chains probed on the way to the chain
+    def edge_at(self, chain, y):
+        low = 0
+        high = self.chains_count() - 1
+
+        for probe in [low, high]:
+            edge = self.__own_edge(probe, y)
+
+            if self.__shares(edge, chain):
+                return edge
+
+        while high - low > 1:
+            probe = (low + high) // 2
+            edge = self.__own_edge(probe, y)
+
+            if self.__shares(edge, chain):
+                return edge
+
+            if chain < probe:
+                high = probe
+            else:
+                low = probe
+
+        return ChainIndex.OUTSIDE
+
+    def __own_edge(self, chain, y):
+        begin = self.chain_offsets[chain]
+        end = self.chain_offsets[chain + 1]
+        slot = begin + self.chain_breaks[begin:end].searchsorted(y)
+
+        if slot == end:
+            return ChainIndex.OUTSIDE
+
+        edge = self.chain_edges[slot]
+        start_y = self.start_y[edge]
+
+        if start_y < y or start_y == self.start_y[self.chain_edges[0]]:
+            return edge
+
+        return ChainIndex.OUTSIDE
+
+    def __shares(self, edge, chain):
+        return edge != ChainIndex.OUTSIDE and self.first_chain[edge] <= chain < self.first_chain[edge] + self.weights[edge]
+
+    def __edge_directions(self, edges, xs, ys):
+        return ChainIndex.edge_directions(
+            self.start_x[edges],
+            self.start_y[edges],
+            self.end_x[edges],
+            self.end_y[edges],
+            xs,
+            ys
+        )
+
+    # edges kept in the chains that contain y: the edge with start.y < y <= end.y
+    # (or the first edge for the lowest y), is_own is False when the chain doesn't keep it
+    def __own_edges(self, ys, chains):
+        low = self.chain_offsets[chains]
+        high = self.chain_offsets[chains + 1]
+
+        while True:
+            sel = numpy.flatnonzero(low < high)
+
+            if len(sel) == 0:
+                break
+
+            mid = (low[sel] + high[sel]) // 2
+            go_up = self.chain_breaks[mid] < ys[sel]
+            low[sel] = numpy.where(go_up, mid + 1, low[sel])
+            high[sel] = numpy.where(go_up, high[sel], mid)
+
+        return self.__own_edges_at(low, ys, chains)
+
+    def __own_edges_at(self, slots, ys, chains):
+        edges = self.chain_edges[numpy.minimum(slots, len(self.chain_edges) - 1)]
+        start_ys = self.start_y[edges]
+        is_own = (slots < self.chain_offsets[chains + 1]) \
+            & ((start_ys < ys) | (start_ys == self.start_y[self.chain_edges[0]]))
+
+        return edges, is_own
+
+    @staticmethod
+    def edge_directions(x_1, y_1, x_2, y_2, x_3, y_3):
+        det = x_1 * y_2 + x_3 * y_1 + x_2 * y_3 - x_3 * y_2 - x_2 * y_1 - x_1 * y_3
+        on_end = ((x_3 == x_1) & (y_3 == y_1)) | ((x_3 == x_2) & (y_3 == y_2))
+
+        # -1 - left side, 0 - on the edge, 1 - right side; the ends of the edge are on it exactly
+        return numpy.where((det == 0) | on_end, 0, numpy.where(det > 0, -1, 1))
@@ -0,0 +1,114 @@
+import io
+import numpy
+
+
+# reads "a b" lines (or an (N, 2) .npy array) straight into an (N, 2) NumPy array
+class Loader:
+    CHUNK_SIZE = 1 << 24
+
+    @staticmethod
+    def load_points(path):
+        return Loader.load(path, numpy.float64)
+
+    @staticmethod
+    def load_edges(path):
+        return Loader.load(path, numpy.int64)
+
+    @staticmethod
+    def load(path, dtype):
+        if str(path).endswith(".npy"):
+            return Loader.__load_binary(path, dtype)
+
+        return Loader.__load_text(path, dtype)
+
+    @staticmethod
+    def __load_binary(path, dtype):
+        array = numpy.load(path, mmap_mode="r")
+
+        if array.ndim != 2 or array.shape[1] != 2:
+            raise ValueError(f"{path}: expected an (N, 2) array, got shape {array.shape}")
+
+        if not numpy.can_cast(array.dtype, dtype, "same_kind"):
+            raise ValueError(f"{path}: expected {numpy.dtype(dtype)} values, got {array.dtype}")
+
+        return array
+
+    @staticmethod
+    def __load_text(path, dtype):
+        with open(path, "rb") as file:
+            lines_count = sum(chunk.count(b"\n") for chunk in iter(lambda: file.read(Loader.CHUNK_SIZE), b""))
+
+        # one row per line is an upper bound, blank lines are skipped
+        result = numpy.empty((lines_count + 1, 2), dtype=dtype)
+        rows = 0
+        first_line = 1
+
+        for chunk in Loader.__chunks(path):
+            values = Loader.__parse(chunk, dtype, path, first_line)
+            result[rows:rows + len(values)] = values
+
+            rows += len(values)
+            first_line += chunk.count(b"\n")
+
+        return result[:rows]
+
+    # pieces of the file cut at line ends
+    @staticmethod
+    def __chunks(path):
+        with open(path, "rb") as file:
+            rest = b""
+
+            while True:
+                data = file.read(Loader.CHUNK_SIZE)
+
+                if len(data) == 0:
+                    if len(rest) > 0:
+                        yield rest
+
+                    return
+
+                data = rest + data
+                end = data.rfind(b"\n") + 1
+                rest = data[end:]
+
+                if end > 0:
+                    yield data[:end]
+
+    @staticmethod
+    def __parse(chunk, dtype, path, first_line):
+        if chunk.isspace():
+            return numpy.empty((0, 2), dtype=dtype)
+
+        try:
+            values = numpy.loadtxt(io.BytesIO(chunk), dtype=dtype, comments=None, ndmin=2)
+        except ValueError:
+            values = None
+
+        if values is None or values.shape[1] != 2:
+            Loader.__report(chunk, dtype, path, first_line)
+
+        return values
+
+    @staticmethod
+    def __report(chunk, dtype, path, first_line):
+        convert = int if numpy.dtype(dtype).kind in "iu" else float
+
+        for i, line in enumerate(chunk.split(b"\n")):
+            tokens = line.split()
+            line_number = first_line + i
+
+            if len(tokens) == 0:
+                continue
+
+            if len(tokens) != 2:
+                raise ValueError(f"{path}:{line_number}: expected 2 values, got {len(tokens)}")
+
+            for token in tokens:
+                try:
+                    convert(token)
+                except ValueError:
+                    raise ValueError(f"{path}:{line_number}: malformed value '{token.decode(errors='replace')}'")
+
+        last_line = first_line + chunk.count(b"\n", 0, len(chunk) - 1)
+
+        raise ValueError(f"{path}:{first_line}-{last_line}: values out of range for {numpy.dtype(dtype)}")
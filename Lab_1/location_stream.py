@@ -0,0 +1,115 @@
+import numpy
+from chain_index import ChainIndex
+
+
+# locates points of a trajectory one by one: the search starts from the previous pair of chains
+# and gallops outwards, each chain remembers the edge it was tested on last time
+class LocationStream:
+    def __init__(self, chain_index):
+        self.index = chain_index
+        self.last = chain_index.chains_count() - 1
+        self.fingers = numpy.full(max(self.last + 1, 0), ChainIndex.OUTSIDE, dtype=numpy.int64)
+        self.low = 0
+        self.high = self.last
+
+        if self.last >= 0:
+            self.y_min = float(chain_index.start_y[chain_index.chain_edges[0]])
+            self.y_max = float(chain_index.chain_breaks[chain_index.chain_offsets[1] - 1])
+
+    def locate(self, x, y):
+        if self.last < 0 or not self.y_min <= y <= self.y_max:
+            return ChainIndex.OUTSIDE, ChainIndex.OUTSIDE
+
+        chain = self.low
+        side = self.__direction(chain, x, y)
+
+        if side == 0:
+            return self.__on_chain(chain)
+
+        # the previous pair is tried first, then the distance doubles
+        inner = chain
+        distance = self.high - self.low if side == 1 and self.high > self.low else 1
+
+        while True:
+            outer = min(max(inner + side * distance, 0), self.last)
+
+            if outer == inner:
+                return ChainIndex.OUTSIDE, ChainIndex.OUTSIDE
+
+            outer_side = self.__direction(outer, x, y)
+
+            if outer_side == 0:
+                return self.__on_chain(outer)
+
+            if outer_side != side:
+                break
+
+            inner = outer
+            distance *= 2
+
+        low = min(inner, outer)
+        high = max(inner, outer)
+
+        while high - low > 1:
+            mid = (low + high) // 2
+            mid_side = self.__direction(mid, x, y)
+
+            if mid_side == 0:
+                return self.__on_chain(mid)
+
+            if mid_side == 1:
+                low = mid
+            else:
+                high = mid
+
+        self.low = low
+        self.high = high
+
+        return low, high
+
+    def locate_many(self, points):
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        result = numpy.empty((len(points), 2), dtype=numpy.int64)
+
+        for i, (x, y) in enumerate(points.tolist()):
+            result[i] = self.locate(x, y)
+
+        return result
+
+    def __direction(self, chain, x, y):
+        index = self.index
+        edge = self.fingers[chain]
+
+        if edge == ChainIndex.OUTSIDE or not self.__contains(edge, y):
+            edge = index.edge_at(chain, y)
+            self.fingers[chain] = edge
+
+        x_1 = float(index.start_x[edge])
+        y_1 = float(index.start_y[edge])
+        x_2 = float(index.end_x[edge])
+        y_2 = float(index.end_y[edge])
+        det = x_1 * y_2 + x * y_1 + x_2 * y - x * y_2 - x_2 * y_1 - x_1 * y
+
+        if det == 0 or (x == x_1 and y == y_1) or (x == x_2 and y == y_2):
+            return 0
+
+        return -1 if det > 0 else 1
+
+    def __contains(self, edge, y):
+        start_y = self.index.start_y[edge]
+
+        return (start_y < y or start_y == self.y_min) and y <= self.index.end_y[edge]
+
+    # a point on an edge shared by several chains belongs to the chain the binary search probes first
+    def __on_chain(self, chain):
+        edge = self.fingers[chain]
+        first = self.index.first_chain[edge]
+        last = first + self.index.weights[edge] - 1
+        probed = ChainIndex.first_probed(numpy.array([first]), numpy.array([last]), self.last + 1)[0]
+
+        if probed == ChainIndex.OUTSIDE:
+            probed = 0 if first == 0 else self.last
+
+        self.low = self.high = probed
+
+        return probed, probed
@@ -1,5 +1,18 @@
-import bisect
 import matplotlib.pyplot as plt
+import numpy
+from enum import Enum
+from chain_index import ChainIndex
+from loader import Loader
+from location_stream import LocationStream
+from parallel_locator import ParallelLocator
+from query_cache import QueryCache
+from slab_index import SlabIndex
+from sweep_status import SweepStatus
+
+
+class Engine(Enum):
+    CHAINS = 1
+    SLABS = 2
 
 
 class Utils:
@@ -7,19 +20,47 @@ class Utils:
     POINT_TEXT_Y_MARGIN = 0.05
 
     @staticmethod
-    def ctg(start, end):
-        dx = end.x - start.x
-        dy = end.y - start.y
+    def direction(x_1, y_1, x_2, y_2, x_3, y_3):
+        det = x_1 * y_2 + x_3 * y_1 + x_2 * y_3 - x_3 * y_2 - x_2 * y_1 - x_1 * y_3
+
+        # the determinant of an end of the edge is zero only up to rounding
+        if det == 0 or (x_3 == x_1 and y_3 == y_1) or (x_3 == x_2 and y_3 == y_2):
+            return 0  # lies on the edge
+
+        return -1 if det > 0 else 1  # -1 - left side, 1 - right side
+
+
+# read-only sequence of views over the graph arrays
+class Views:
+    def __init__(self, count, factory):
+        self.count = count
+        self.factory = factory
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, i):
+        count = self.count()
 
-        return dx / dy
+        if i < 0:
+            i += count
+
+        if not 0 <= i < count:
+            raise IndexError("View index out of range")
+
+        return self.factory(i)
+
+    def __iter__(self):
+        for i in range(self.count()):
+            yield self.factory(i)
 
 
 class Point:
-    def __init__(self, x, y):
+    def __init__(self, x, y, graph=None, index=None):
         self.x = x
         self.y = y
-        self.in_edges = []
-        self.out_edges = []
+        self.graph = graph
+        self.index = index
 
     def __str__(self):
         return f"({self.x}, {self.y})"
@@ -30,89 +71,101 @@ class Point:
     def __lt__(self, other):
         return [self.y, self.x] < [other.y, other.x]
 
+    @property
+    def in_edges(self):
+        return [self.graph.edge(i) for i in self.graph.in_edges_of(self.index)]
+
+    @property
+    def out_edges(self):
+        return [self.graph.edge(i) for i in self.graph.out_edges_of(self.index)]
+
     def w_in(self):
-        return sum(edge.w for edge in self.in_edges)
+        return int(self.graph.weights[self.graph.in_edges_of(self.index)].sum())
 
     def w_out(self):
-        return sum(edge.w for edge in self.out_edges)
-
-    def add_edge(self, edge):
-        if self == edge.start:
-            bisect.insort(self.out_edges, edge, key=lambda elem: elem.ctg)
-        else:
-            bisect.insort(self.in_edges, edge, key=lambda elem: -elem.ctg)
+        return int(self.graph.weights[self.graph.out_edges_of(self.index)].sum())
 
 
 class Edge:
-    def __init__(self, start, end):
-        if start < end:
-            self.start = start
-            self.end = end
-        else:
-            self.start = end
-            self.end = start
-
-        self.ctg = Utils.ctg(start, end)
-        self.w = 1
-
-        start.add_edge(self)
-        end.add_edge(self)
+    def __init__(self, graph, index):
+        self.graph = graph
+        self.index = index
 
     def __str__(self):
         return f"{self.start} -> {self.end}, ctg={self.ctg}, w={self.w}"
 
-    def get_point_direction(self, point):
-        x_1 = self.start.x
-        x_2 = self.end.x
-        x_3 = point.x
+    def __eq__(self, other):
+        return self.graph is other.graph and self.index == other.index
 
-        y_1 = self.start.y
-        y_2 = self.end.y
-        y_3 = point.y
+    def __hash__(self):
+        return hash(self.index)
 
-        det = x_1 * y_2 + x_3 * y_1 + x_2 * y_3 - x_3 * y_2 - x_2 * y_1 - x_1 * y_3
+    @property
+    def start(self):
+        return self.graph.point(self.graph.edge_starts[self.index])
 
-        if det == 0:
-            return 0  # lies on the edge
+    @property
+    def end(self):
+        return self.graph.point(self.graph.edge_ends[self.index])
 
-        return -1 if det > 0 else 1  # -1 - left side, 1 - right side
+    @property
+    def ctg(self):
+        return float(self.graph.ctgs[self.index])
+
+    @property
+    def w(self):
+        return int(self.graph.weights[self.index])
+
+    @w.setter
+    def w(self, value):
+        self.graph.weights[self.index] = value
+
+    def get_point_direction(self, point):
+        return self.graph.edge_direction(self.index, point.x, point.y)
 
 
 class Chain:
-    def __init__(self, edges, number):
-        self.edges = edges
+    def __init__(self, graph, number):
+        self.graph = graph
         self.number = number
 
+    @property
+    def edges(self):
+        return [self.graph.edge(i) for i in self.__edge_ids()]
+
     def get_point_direction(self, point):
         edge = self.__localize_point_by_y(point)
 
         if edge is None:
             return None
 
-        return edge.get_point_direction(point)
+        return self.graph.edge_direction(edge, point.x, point.y)
 
+    def __edge_ids(self):
+        return self.graph.chain_edges_of(self.number)
+
+    # the edge is found through the index, the chain itself isn't walked;
+    # at the y of a vertex it is the edge below the vertex
     def __localize_point_by_y(self, point):
-        if point.y > self.edges[-1].end.y or point.y < self.edges[0].start.y:
+        cache = self.graph.cache
+
+        if cache is not None:
+            edge = cache.slab_edge(self.number, point.y)
+
+            if edge is not None:
+                return edge
+
+        edge = self.graph.get_index().edge_at(self.number, point.y)
+
+        if edge == ChainIndex.OUTSIDE:
             return None
 
-        low = 0
-        high = len(self.edges) - 1
-        result = 0
-        is_found = False
-
-        while not is_found:
-            mid = (high + low) // 2
-            edge = self.edges[mid]
-
-            if edge.start.y <= point.y <= edge.end.y:
-                is_found = True
-                result = mid
-            elif point.y > edge.end.y:
-                low = mid + 1
-            else:
-                high = mid - 1
+        if cache is not None:
+            start_y = self.graph.ys[self.graph.edge_starts[edge]]
+            end_y = self.graph.ys[self.graph.edge_ends[edge]]
+            cache.remember_slab(self.number, start_y, end_y, edge)
 
-        return self.edges[result]
+        return edge
 
     def print(self):
         for edge in self.edges:
@@ -120,43 +173,378 @@ class Chain:
 
 
 class Graph:
-    def __init__(self, points_file, edges_file):
-        self.points = []
-        self.edges = []
-        self.chains = []
+    def __init__(self, points_file, edges_file, engine=Engine.CHAINS, cache_size=0):
+        self.engine = engine
+        self.cache = QueryCache(cache_size) if cache_size > 0 else None
+        self.first_chain = None
+        self.index = None
+        self.slab_index = None
 
-        points_strs = open(points_file).read().split()
-        edges_strs = open(edges_file).read().split()
+        self.points = Views(lambda: len(self.xs), self.point)
+        self.edges = Views(lambda: len(self.edge_starts), self.edge)
+        self.chains = Views(self.chains_count, self.chain)
 
-        self.__init_points(points_strs)
-        self.__init_edges(edges_strs)
+        ranks = self.__init_points(Loader.load_points(points_file))
+        self.__init_edges(Loader.load_edges(edges_file), ranks)
 
-        self.points.sort()
+    # points are kept sorted by (y, x), returns positions of the input points in that order
+    def __init_points(self, coords):
+        order = numpy.lexsort((coords[:, 0], coords[:, 1]))
 
-    def __init_points(self, points_strs):
-        for i in range(0, len(points_strs) - 1, 2):
-            x = float(points_strs[i])
-            y = float(points_strs[i + 1])
-            self.points.append(Point(x, y))
+        self.xs = numpy.asarray(coords[order, 0], dtype=numpy.float64)
+        self.ys = numpy.asarray(coords[order, 1], dtype=numpy.float64)
 
-    def __init_edges(self, edges_strs):
-        for i in range(0, len(edges_strs) - 1, 2):
-            from_point = self.points[int(edges_strs[i])]
-            to_point = self.points[int(edges_strs[i + 1])]
+        ranks = numpy.empty(len(order), dtype=numpy.int64)
+        ranks[order] = numpy.arange(len(order))
 
-            edge_to_add = Edge(from_point, to_point)
-            self.edges.append(edge_to_add)
+        return ranks
+
+    def __init_edges(self, pairs, ranks):
+        if len(pairs) > 0 and (pairs.min() < 0 or pairs.max() >= len(ranks)):
+            raise ValueError("Edge refers to a missing point")
+
+        self.edge_starts = numpy.zeros(0, dtype=numpy.int64)
+        self.edge_ends = numpy.zeros(0, dtype=numpy.int64)
+        self.weights = numpy.zeros(0, dtype=numpy.int64)
+
+        self.__add_edges(ranks[pairs[:, 0]], ranks[pairs[:, 1]])
+
+    def __add_edges(self, firsts, seconds):
+        firsts = numpy.asarray(firsts, dtype=numpy.int64)
+        seconds = numpy.asarray(seconds, dtype=numpy.int64)
+
+        # points are sorted, so the lower index is the lower point
+        self.edge_starts = numpy.concatenate([self.edge_starts, numpy.minimum(firsts, seconds)])
+        self.edge_ends = numpy.concatenate([self.edge_ends, numpy.maximum(firsts, seconds)])
+        self.weights = numpy.concatenate([self.weights, numpy.ones(len(firsts), dtype=numpy.int64)])
+
+        self.ctgs = (self.xs[self.edge_ends] - self.xs[self.edge_starts]) \
+            / (self.ys[self.edge_ends] - self.ys[self.edge_starts])
+
+        self.__build_adjacency()
+
+    # CSR adjacency: 'out' edges sorted by ctg, 'in' edges sorted by -ctg (both from left to right)
+    def __build_adjacency(self):
+        ids = numpy.arange(len(self.edge_starts))
+        points_count = len(self.xs)
+
+        self.out_adjacency = numpy.lexsort((ids, self.ctgs, self.edge_starts))
+        self.out_offsets = Graph.__offsets(self.edge_starts, points_count)
+
+        self.in_adjacency = numpy.lexsort((ids, -self.ctgs, self.edge_ends))
+        self.in_offsets = Graph.__offsets(self.edge_ends, points_count)
+
+    @staticmethod
+    def __offsets(owners, count):
+        offsets = numpy.zeros(count + 1, dtype=numpy.int64)
+        offsets[1:] = numpy.cumsum(numpy.bincount(owners, minlength=count))
+
+        return offsets
+
+    def point(self, i):
+        return Point(float(self.xs[i]), float(self.ys[i]), self, int(i))
+
+    def edge(self, i):
+        return Edge(self, int(i))
+
+    def chain(self, number):
+        return Chain(self, number)
+
+    def chains_count(self):
+        return 0 if self.first_chain is None else int(self.weights[self.out_edges_of(0)].sum())
+
+    # chains aren't stored, chain 'number' is walked from the source through the 'out' edges sharing it
+    def chain_edges_of(self, number):
+        return numpy.array(self.__chain_edges_up(0, number), dtype=numpy.int64)
+
+    def __chain_edges_up(self, point, number):
+        result = []
+
+        while self.out_offsets[point] != self.out_offsets[point + 1]:
+            out_edges = self.out_edges_of(point)
+            edge = out_edges[numpy.searchsorted(self.first_chain[out_edges], number, side="right") - 1]
+            result.append(edge)
+            point = self.edge_ends[edge]
+
+        return result
+
+    def __chain_edges_down(self, point, number):
+        result = []
+
+        while self.in_offsets[point] != self.in_offsets[point + 1]:
+            in_edges = self.in_edges_of(point)
+            edge = in_edges[numpy.searchsorted(self.first_chain[in_edges], number, side="right") - 1]
+            result.append(edge)
+            point = self.edge_starts[edge]
+
+        return result[::-1]
+
+    def in_edges_of(self, i):
+        return self.in_adjacency[self.in_offsets[i]:self.in_offsets[i + 1]]
+
+    def out_edges_of(self, i):
+        return self.out_adjacency[self.out_offsets[i]:self.out_offsets[i + 1]]
+
+    def edge_direction(self, edge, x, y):
+        start = self.edge_starts[edge]
+        end = self.edge_ends[edge]
+
+        return Utils.direction(self.xs[start], self.ys[start], self.xs[end], self.ys[end], x, y)
+
+    # 'verbose' prints the regularization, the demo shows it
+    def build(self, verbose=False):
+        if self.first_chain is not None:
+            return
 
-    def demo(self, point_to_locate):
         if not self.__is_regular():
-            print("Graph isn't regular. Regularization started.")
-            self.__regularize()
+            if verbose:
+                print("Graph isn't regular. Regularization started.")
+
+            self.__regularize(verbose)
 
         self.__balance()
+        self.__build_chains()
+
+    def locate_many(self, points):
+        if self.engine == Engine.SLABS:
+            return self.get_slab_index().locate_many(points)
+
+        return self.get_index().locate_many(points)
+
+    def get_index(self):
+        self.build()
+
+        if self.index is None:
+            self.index = ChainIndex.from_edges(
+                self.xs[self.edge_starts],
+                self.ys[self.edge_starts],
+                self.xs[self.edge_ends],
+                self.ys[self.edge_ends],
+                self.weights.copy(),
+                self.first_chain.copy()
+            )
+
+        return self.index
+
+    def stream(self):
+        return LocationStream(self.get_index())
+
+    def parallel_locator(self, processes=None):
+        return ParallelLocator(self.get_index(), processes)
+
+    def get_slab_index(self):
+        if self.slab_index is None:
+            self.slab_index = SlabIndex(self, self.get_index())
+
+        return self.slab_index
+
+    def save_index(self, path):
+        self.get_index().save(path)
+
+    # edits of a built graph keep its chains: the new edges get one new chain that runs along
+    # the neighbouring chains, so only the weights on its way and the numbers of the chains to the right change
+    def insert_edge(self, first, second):
+        if not (0 <= first < len(self.xs) and 0 <= second < len(self.xs)) or first == second:
+            raise ValueError("Edge refers to a missing point")
+
+        start = min(first, second)
+        end = max(first, second)
+
+        if end in self.edge_ends[self.out_edges_of(start)]:
+            raise ValueError("Edge already exists")
+
+        if self.first_chain is None:
+            return self.__push_edge(start, end, 1, 0)
+
+        ctg = (self.xs[end] - self.xs[start]) / (self.ys[end] - self.ys[start])
+        chain, end_chain = self.__gap_of(start, end, ctg, ctg)
+
+        if chain != end_chain or not self.__fits_between(start, end, chain):
+            raise ValueError("Edge crosses the subdivision")
+
+        below = self.__chain_edges_down(start, self.__neighbour_chain(self.out_edges_of(start), chain))
+        above = self.__chain_edges_up(end, self.__neighbour_chain(self.in_edges_of(end), chain))
+        edge = self.__push_edge(start, end, 0, chain)
+
+        self.__insert_chain(chain, below + [edge] + above)
+
+        return edge
+
+    # a point between two chains is joined to the nearest vertices of these chains below and above it,
+    # a point on a chain splits the edge it lies on
+    def insert_vertex(self, x, y):
+        point = int(numpy.searchsorted(self.ys, y, side="left"))
+        point += int(numpy.searchsorted(self.xs[point:numpy.searchsorted(self.ys, y, side="right")], x))
+
+        if point < len(self.xs) and self.xs[point] == x and self.ys[point] == y:
+            raise ValueError("Point already exists")
+
+        if self.first_chain is None:
+            self.__push_point(point, x, y)
+
+            return point
+
+        low, high = self.get_index().locate_many([[x, y]])[0]
+
+        if low == ChainIndex.OUTSIDE:
+            raise ValueError("Point is outside the subdivision")
+
+        if low == high:
+            edge = self.__straddling_edge(low, point)
+            end = self.edge_ends[edge]
+
+            self.__push_point(point, x, y)
+            self.__push_edge(point, end + 1, self.weights[edge], self.first_chain[edge])
+            self.__move_edge_end(edge, point)
+        else:
+            left = self.__straddling_edge(low, point)
+            right = self.__straddling_edge(high, point)
+            lower = max(self.edge_starts[left], self.edge_starts[right])
+            upper = min(self.edge_ends[left], self.edge_ends[right])
+
+            # the new edges have to fall between the chains in the order of ctg too
+            lower_ctg = (x - self.xs[lower]) / (y - self.ys[lower])
+            upper_ctg = (self.xs[upper] - x) / (self.ys[upper] - y)
+
+            if self.__gap_of(lower, upper, lower_ctg, upper_ctg) != (high, high):
+                raise ValueError("Point is too close to an edge")
+
+            below = self.__chain_edges_down(lower, self.__neighbour_chain(self.out_edges_of(lower), high))
+            above = self.__chain_edges_up(upper, self.__neighbour_chain(self.in_edges_of(upper), high))
+
+            self.__push_point(point, x, y)
+            in_edge = self.__push_edge(lower, point, 0, high)
+            out_edge = self.__push_edge(point, upper + 1, 0, high)
+
+            self.__insert_chain(high, below + [in_edge, out_edge] + above)
+
+        return point
+
+    # numbers the new chain gets at 'lower' and at 'upper' when it leaves 'lower' with ctg 'out_ctg'
+    # and enters 'upper' with ctg 'in_ctg', the edges are ordered by ctg as the adjacency keeps them
+    def __gap_of(self, lower, upper, out_ctg, in_ctg):
+        out_edges = self.out_edges_of(lower)
+        in_edges = self.in_edges_of(upper)
+
+        return (
+            self.__chain_gap(out_edges, numpy.searchsorted(self.ctgs[out_edges], out_ctg, side="right")),
+            self.__chain_gap(in_edges, numpy.searchsorted(-self.ctgs[in_edges], -in_ctg, side="right"))
+        )
+
+    # both ends of a new edge being in the same gap doesn't keep it from cutting through the chains
+    # of that gap on its way: their vertices between its ends have to stay strictly on their sides of it
+    def __fits_between(self, start, end, chain):
+        for number, side in [(chain - 1, -1), (chain, 1)]:
+            if not 0 <= number < self.chains_count():
+                continue
+
+            points = self.edge_starts[self.chain_edges_of(number)]
+
+            for point in points[(start < points) & (points < end)].tolist():
+                direction = Utils.direction(
+                    self.xs[start], self.ys[start], self.xs[end], self.ys[end], self.xs[point], self.ys[point]
+                )
+
+                if direction != side:
+                    return False
+
+        return True
+
+    # number the new chain gets when its edge is put at 'position' among the ordered edges of a point
+    def __chain_gap(self, edges, position):
+        if position < len(edges):
+            return self.first_chain[edges[position]]
+
+        return self.first_chain[edges[-1]] + self.weights[edges[-1]]
+
+    # the chain passing a point that the new chain runs along
+    def __neighbour_chain(self, edges, chain):
+        last = self.first_chain[edges[-1]] + self.weights[edges[-1]] - 1
+
+        return chain if chain <= last else chain - 1
+
+    def __straddling_edge(self, number, point):
+        edges = self.chain_edges_of(number)
+
+        return edges[numpy.searchsorted(self.edge_starts[edges], point) - 1]
+
+    def __insert_chain(self, chain, edges):
+        on_chain = numpy.zeros(len(self.weights), dtype=bool)
+        on_chain[edges] = True
+
+        self.first_chain += (self.first_chain > chain) | ((self.first_chain == chain) & ~on_chain)
+        self.weights[edges] += 1
+
+        self.__drop_indexes()
+
+    def __drop_indexes(self):
+        self.index = None
+        self.slab_index = None
+
+        if self.cache is not None:
+            self.cache.clear()
+
+    def __push_point(self, point, x, y):
+        self.xs = numpy.insert(self.xs, point, x)
+        self.ys = numpy.insert(self.ys, point, y)
+
+        self.edge_starts += self.edge_starts >= point
+        self.edge_ends += self.edge_ends >= point
+        self.out_offsets = numpy.insert(self.out_offsets, point, self.out_offsets[point])
+        self.in_offsets = numpy.insert(self.in_offsets, point, self.in_offsets[point])
+
+        self.__drop_indexes()
+
+    def __push_edge(self, start, end, weight, first_chain):
+        edge = len(self.edge_starts)
+
+        self.edge_starts = numpy.append(self.edge_starts, start)
+        self.edge_ends = numpy.append(self.edge_ends, end)
+        self.weights = numpy.append(self.weights, weight)
+        self.ctgs = numpy.append(self.ctgs, (self.xs[end] - self.xs[start]) / (self.ys[end] - self.ys[start]))
+
+        if self.first_chain is not None:
+            self.first_chain = numpy.append(self.first_chain, first_chain)
+
+        self.__attach_out(edge)
+        self.__attach_in(edge)
+
+        self.__drop_indexes()
+
+        return edge
+
+    def __move_edge_end(self, edge, end):
+        old_end = self.edge_ends[edge]
+        position = self.in_offsets[old_end] + numpy.flatnonzero(self.in_edges_of(old_end) == edge)[0]
+
+        self.in_adjacency = numpy.delete(self.in_adjacency, position)
+        self.in_offsets[old_end + 1:] -= 1
+        self.edge_ends[edge] = end
+
+        self.__attach_in(edge)
+
+    # new edges have the greatest ids, so they go after the edges with the same ctg
+    def __attach_out(self, edge):
+        start = self.edge_starts[edge]
+        out_edges = self.out_edges_of(start)
+        position = self.out_offsets[start] + numpy.searchsorted(self.ctgs[out_edges], self.ctgs[edge], side="right")
+
+        self.out_adjacency = numpy.insert(self.out_adjacency, position, edge)
+        self.out_offsets[start + 1:] += 1
+
+    def __attach_in(self, edge):
+        end = self.edge_ends[edge]
+        in_edges = self.in_edges_of(end)
+        position = self.in_offsets[end] + numpy.searchsorted(-self.ctgs[in_edges], -self.ctgs[edge], side="right")
+
+        self.in_adjacency = numpy.insert(self.in_adjacency, position, edge)
+        self.in_offsets[end + 1:] += 1
+
+    def demo(self, point_to_locate):
+        self.build(verbose=True)
         self.__print_graph()
         self.__plot_edges()
         self.__plot_points(point_to_locate)
-        self.__build_chains()
         self.__print_chains()
 
         borders = self.__localize_point(point_to_locate)
@@ -166,139 +554,99 @@ class Graph:
         plt.show()
 
     def __is_regular(self):
-        for i in range(1, len(self.points) - 1):
-            if len(self.points[i].in_edges) == 0 \
-                    or len(self.points[i].out_edges) == 0:
-                return False
-
-        return True
-
-    def __regularize(self):
-        self.__regularize_forward()
-        self.__regularize_backward()
-
-    def __regularize_forward(self):
-        status_edges = self.points[0].out_edges[:]
-        status_points = [self.points[0]] * (len(status_edges) + 1)
+        in_degrees = numpy.diff(self.in_offsets)[1:-1]
+        out_degrees = numpy.diff(self.out_offsets)[1:-1]
 
-        for i in range(1, len(self.points)):
-            cur_point = self.points[i]
+        return bool((in_degrees > 0).all() and (out_degrees > 0).all())
 
-            if len(cur_point.in_edges) == 0:
-                idx = self.__localize_point_in_status(status_edges, cur_point)
+    def __regularize(self, verbose):
+        self.__regularize_forward(verbose)
+        self.__regularize_backward(verbose)
 
-                edge_to_append = Edge(cur_point, status_points[idx])
-                print(f"Added:\n{edge_to_append}")
-                self.edges.append(edge_to_append)
+    def __regularize_forward(self, verbose):
+        status = SweepStatus(self.out_edges_of(0).tolist(), 0, self.__point_direction)
+        added = []
 
-                status_edges = \
-                    status_edges[:idx] \
-                    + cur_point.out_edges \
-                    + status_edges[idx:]
+        for cur_point in range(1, len(self.xs)):
+            in_edges = self.in_edges_of(cur_point).tolist()
+            out_edges = self.out_edges_of(cur_point).tolist()
 
-                status_points = \
-                    status_points[:idx] \
-                    + [cur_point] * (len(cur_point.out_edges) + 1) \
-                    + status_points[idx + 1:]
+            if len(in_edges) == 0:
+                node = status.locate(cur_point)
+                added.append((cur_point, node.point))
+                status.replace(node, 0, out_edges, cur_point)
             else:
-                idx = status_edges.index(cur_point.in_edges[0])
-                status_edges = \
-                    status_edges[:idx] \
-                    + cur_point.out_edges \
-                    + status_edges[idx + len(cur_point.in_edges):]
-
-                status_points = \
-                    status_points[:idx] \
-                    + [cur_point] * (len(cur_point.out_edges) + 1) \
-                    + status_points[idx + len(cur_point.in_edges) + 1:]
-
-                if len(status_points) == 0:
-                    status_points.append(cur_point)
-
-    def __regularize_backward(self):
-        status_edges = self.points[-1].in_edges[:]
-        status_points = [self.points[-1]] * (len(status_edges) + 1)
-
-        for i in range(len(self.points) - 2, -1, -1):
-            cur_point = self.points[i]
-
-            if len(cur_point.out_edges) == 0:
-                idx = self.__localize_point_in_status(status_edges, cur_point)
-
-                edge_to_append = Edge(cur_point, status_points[idx])
-                print(f"Added:\n{edge_to_append}")
-                self.edges.append(edge_to_append)
-
-                status_edges = \
-                    status_edges[:idx] \
-                    + cur_point.in_edges \
-                    + status_edges[idx:]
-
-                status_points = \
-                    status_points[:idx] \
-                    + [cur_point] * (len(cur_point.in_edges) + 1) \
-                    + status_points[idx + 1:]
-            else:
-                idx = status_edges.index(cur_point.out_edges[0])
+                status.replace(status.node_of(in_edges[0]), len(in_edges), out_edges, cur_point)
 
-                status_edges = \
-                    status_edges[:idx] \
-                    + cur_point.in_edges \
-                    + status_edges[idx + len(cur_point.out_edges):]
+        self.__append_edges(added, verbose)
 
-                status_points = \
-                    status_points[:idx] \
-                    + [cur_point] * (len(cur_point.in_edges) + 1) \
-                    + status_points[idx + len(cur_point.out_edges) + 1:]
+    def __regularize_backward(self, verbose):
+        status = SweepStatus(self.in_edges_of(len(self.xs) - 1).tolist(), len(self.xs) - 1, self.__point_direction)
+        added = []
 
-                if len(status_points) == 0:
-                    status_points.append(cur_point)
+        for cur_point in range(len(self.xs) - 2, -1, -1):
+            in_edges = self.in_edges_of(cur_point).tolist()
+            out_edges = self.out_edges_of(cur_point).tolist()
 
-    def __localize_point_in_status(self, status_edges, point):
-        if len(status_edges) == 0:
-            return 0
+            if len(out_edges) == 0:
+                node = status.locate(cur_point)
+                added.append((cur_point, node.point))
+                status.replace(node, 0, in_edges, cur_point)
+            else:
+                status.replace(status.node_of(out_edges[0]), len(out_edges), in_edges, cur_point)
 
-        low = 0
-        high = len(status_edges) - 1
+        self.__append_edges(added, verbose)
 
-        while high - low > 1:
-            mid = (low + high) // 2
+    def __append_edges(self, pairs, verbose):
+        first_added = len(self.edge_starts)
+        self.__add_edges([pair[0] for pair in pairs], [pair[1] for pair in pairs])
 
-            if status_edges[mid].get_point_direction(point) == -1:
-                high = mid
-            else:
-                low = mid
-
-        if status_edges[high].get_point_direction(point) == 1:
-            return high + 1
+        if not verbose:
+            return
 
-        if status_edges[low].get_point_direction(point) == -1:
-            return low
+        for i in range(first_added, len(self.edge_starts)):
+            print(f"Added:\n{self.edge(i)}")
 
-        return high
+    def __point_direction(self, edge, point):
+        return self.edge_direction(edge, self.xs[point], self.ys[point])
 
     def __balance(self):
         self.__balance_forward()
         self.__balance_backward()
 
     def __balance_forward(self):
-        for i in range(1, len(self.points) - 1):
-            point = self.points[i]
-            w_in = point.w_in()
-            leftmost_edge = point.out_edges[0]
+        weights = self.weights.tolist()
+        in_offsets = self.in_offsets.tolist()
+        in_adjacency = self.in_adjacency.tolist()
+        out_offsets = self.out_offsets.tolist()
+        out_adjacency = self.out_adjacency.tolist()
 
-            if w_in > len(point.out_edges):
-                leftmost_edge.w = w_in - len(point.out_edges) + 1
+        for i in range(1, len(self.xs) - 1):
+            w_in = sum(weights[edge] for edge in in_adjacency[in_offsets[i]:in_offsets[i + 1]])
+            out_count = out_offsets[i + 1] - out_offsets[i]
+            leftmost_edge = out_adjacency[out_offsets[i]]
+
+            if w_in > out_count:
+                weights[leftmost_edge] = w_in - out_count + 1
+
+        self.weights = numpy.array(weights, dtype=numpy.int64)
 
     def __balance_backward(self):
-        for i in range(len(self.points) - 1, 0, -1):
-            point = self.points[i]
-            w_out = point.w_out()
-            w_in = point.w_in()
-            leftmost_edge = point.in_edges[0]
+        weights = self.weights.tolist()
+        in_offsets = self.in_offsets.tolist()
+        in_adjacency = self.in_adjacency.tolist()
+        out_offsets = self.out_offsets.tolist()
+        out_adjacency = self.out_adjacency.tolist()
+
+        for i in range(len(self.xs) - 1, 0, -1):
+            w_out = sum(weights[edge] for edge in out_adjacency[out_offsets[i]:out_offsets[i + 1]])
+            w_in = sum(weights[edge] for edge in in_adjacency[in_offsets[i]:in_offsets[i + 1]])
+            leftmost_edge = in_adjacency[in_offsets[i]]
 
             if w_out > w_in:
-                leftmost_edge.w += w_out - w_in
+                weights[leftmost_edge] += w_out - w_in
+
+        self.weights = numpy.array(weights, dtype=numpy.int64)
 
     def __plot_edges(self):
         for edge in self.edges:
@@ -330,33 +678,25 @@ class Graph:
 
         plt.plot(point_to_locate.x, point_to_locate.y, "or")
 
+    # chains passing a point are consecutive and leave it through its 'out' edges from left to right,
+    # so an edge is shared by chains first_chain[edge] .. first_chain[edge] + weights[edge] - 1
     def __build_chains(self):
-        chains_counter = 0
+        weights = self.weights.tolist()
+        in_offsets = self.in_offsets.tolist()
+        in_adjacency = self.in_adjacency.tolist()
+        out_offsets = self.out_offsets.tolist()
+        out_adjacency = self.out_adjacency.tolist()
+        first_chain = [0] * len(weights)
 
-        while True:
-            cur_point = self.points[0]
+        for i in range(len(self.xs)):
+            in_edges = in_adjacency[in_offsets[i]:in_offsets[i + 1]]
+            chain = min((first_chain[edge] for edge in in_edges), default=0)
 
-            start_edge = next(
-                (edge for edge in cur_point.out_edges if edge.w > 0),
-                None
-            )
-
-            if start_edge is None:
-                break
-
-            start_edge.w -= 1
-            chain = Chain([start_edge], chains_counter)
-            cur_point = start_edge.end
+            for edge in out_adjacency[out_offsets[i]:out_offsets[i + 1]]:
+                first_chain[edge] = chain
+                chain += weights[edge]
 
-            while cur_point != self.points[-1]:
-                edge_to_add = next(
-                    edge for edge in cur_point.out_edges if edge.w > 0)
-                edge_to_add.w -= 1
-                chain.edges.append(edge_to_add)
-                cur_point = edge_to_add.end
-
-            self.chains.append(chain)
-            chains_counter += 1
+        self.first_chain = numpy.array(first_chain, dtype=numpy.int64)
 
     def __print_graph(self):
         for point in self.points:
@@ -375,7 +715,26 @@ class Graph:
             print(f"Chain: {i}")
             self.chains[i].print()
 
+    # a point at a vertex is on every chain through the vertex; before the index the direction of a vertex
+    # was the sign of a rounded determinant, so such points were put to either side or even outside
+    def locate(self, point):
+        self.build()
+
+        return self.__localize_point(point)
+
     def __localize_point(self, point):
+        if self.cache is None:
+            return self.__search_chains(point)
+
+        numbers = self.cache.answer(point.x, point.y)
+
+        if numbers is None:
+            numbers = [chain.number for chain in self.__search_chains(point)]
+            self.cache.remember_answer(point.x, point.y, numbers)
+
+        return [self.chain(number) for number in numbers]
+
+    def __search_chains(self, point):
         if self.chains[0].get_point_direction(point) is None or \
            self.chains[0].get_point_direction(point) == -1 or \
            self.chains[-1].get_point_direction(point) == 1:
@@ -0,0 +1,84 @@
+import multiprocessing
+import numpy
+from multiprocessing import shared_memory
+from chain_index import ChainIndex
+
+
+# the packed chain index lives in shared memory, the pool workers attach to it without copying;
+# queries and answers are passed through another shared block, the workers get only row ranges
+class ParallelLocator:
+    CHUNK_SIZE = 1 << 16
+
+    # state of a worker process
+    worker_memory = None
+    worker_index = None
+
+    def __init__(self, chain_index, processes=None):
+        header, arrays = chain_index.pack()
+        size = len(header) + sum(array.nbytes for array in arrays)
+
+        self.memory = shared_memory.SharedMemory(create=True, size=size)
+        self.memory.buf[:len(header)] = header
+        offset = len(header)
+
+        for array in arrays:
+            self.memory.buf[offset:offset + array.nbytes] = memoryview(array).cast("B")
+            offset += array.nbytes
+
+        self.pool = multiprocessing.Pool(processes, ParallelLocator.attach, (self.memory.name,))
+
+    def locate_many(self, points):
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        count = len(points)
+
+        if count == 0:
+            return numpy.zeros((0, 2), dtype=numpy.int64)
+
+        # points go first, answers follow them
+        batch = shared_memory.SharedMemory(create=True, size=count * 32)
+
+        try:
+            shared_points = numpy.ndarray((count, 2), dtype=numpy.float64, buffer=batch.buf)
+            shared_points[:] = points
+
+            ranges = [
+                (batch.name, count, begin, min(begin + ParallelLocator.CHUNK_SIZE, count))
+                for begin in range(0, count, ParallelLocator.CHUNK_SIZE)
+            ]
+            self.pool.starmap(ParallelLocator.locate_range, ranges)
+
+            result = numpy.ndarray((count, 2), dtype=numpy.int64, buffer=batch.buf, offset=count * 16).copy()
+            del shared_points
+        finally:
+            batch.close()
+            batch.unlink()
+
+        return result
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def attach(name):
+        ParallelLocator.worker_memory = shared_memory.SharedMemory(name=name)
+        ParallelLocator.worker_index = ChainIndex.from_buffer(ParallelLocator.worker_memory.buf, verify=False)
+
+    @staticmethod
+    def locate_range(name, count, begin, end):
+        batch = shared_memory.SharedMemory(name=name)
+        points = numpy.ndarray((count, 2), dtype=numpy.float64, buffer=batch.buf)
+        result = numpy.ndarray((count, 2), dtype=numpy.int64, buffer=batch.buf, offset=count * 16)
+
+        result[begin:end] = ParallelLocator.worker_index.locate_many(points[begin:end])
+
+        del points, result
+        batch.close()
@@ -0,0 +1,61 @@
+from collections import OrderedDict
+
+
+# bounded LRU caches for the point location: answers for exact points
+# and the last edge each chain has found, kept with the y-interval of that edge
+class QueryCache:
+    def __init__(self, size):
+        if size <= 0:
+            raise ValueError("Cache size must be positive")
+
+        self.size = size
+        self.answers = OrderedDict()
+        self.slabs = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.slab_hits = 0
+        self.slab_misses = 0
+
+    def answer(self, x, y):
+        key = (x, y)
+
+        if key not in self.answers:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.answers.move_to_end(key)
+
+        return self.answers[key]
+
+    def remember_answer(self, x, y, chains):
+        QueryCache.__put(self.answers, (x, y), chains, self.size)
+
+    # only the inner part of the interval is used: at its ends the edge touches the next one
+    def slab_edge(self, chain, y):
+        slab = self.slabs.get(chain)
+
+        if slab is None or not slab[0] < y < slab[1]:
+            self.slab_misses += 1
+            return None
+
+        self.slab_hits += 1
+        self.slabs.move_to_end(chain)
+
+        return slab[2]
+
+    def remember_slab(self, chain, start_y, end_y, edge):
+        QueryCache.__put(self.slabs, chain, (start_y, end_y, edge), self.size)
+
+    def clear(self):
+        self.answers.clear()
+        self.slabs.clear()
+
+    @staticmethod
+    def __put(entries, key, value, size):
+        entries[key] = value
+        entries.move_to_end(key)
+
+        if len(entries) > size:
+            entries.popitem(last=False)
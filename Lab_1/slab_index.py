@@ -0,0 +1,177 @@
+import random
+import numpy
+from chain_index import ChainIndex
+
+
+# slab method: one version of a persistent (path copying) treap of the edges crossing each slab
+class SlabIndex:
+    def __init__(self, graph, chain_index):
+        self.__node_edge = []
+        self.__node_left = []
+        self.__node_right = []
+        self.__node_priority = []
+        self.__node_size = []
+
+        self.start_x = chain_index.start_x
+        self.start_y = chain_index.start_y
+        self.end_x = chain_index.end_x
+        self.end_y = chain_index.end_y
+        self.chains_count = chain_index.chains_count()
+        self.first_chain = graph.first_chain
+
+        self.slab_ys, self.roots = self.__build_slabs(graph)
+
+        self.node_edge = numpy.array(self.__node_edge, dtype=numpy.int64)
+        self.node_left = numpy.array(self.__node_left, dtype=numpy.int64)
+        self.node_right = numpy.array(self.__node_right, dtype=numpy.int64)
+
+    def __build_slabs(self, graph):
+        ys = graph.ys.tolist()
+        slab_ys = []
+        roots = []
+        root = -1
+
+        for point in range(len(ys)):
+            rank = self.__rank(root, point, graph)
+            left, rest = self.__split(root, rank)
+            _, right = self.__split(rest, len(graph.in_edges_of(point)))
+
+            inserted = -1
+
+            for edge in graph.out_edges_of(point).tolist():
+                inserted = self.__merge(inserted, self.__new_node(edge))
+
+            root = self.__merge(self.__merge(left, inserted), right)
+
+            if point + 1 == len(ys) or ys[point + 1] != ys[point]:
+                slab_ys.append(ys[point])
+                roots.append(root)
+
+        return numpy.array(slab_ys, dtype=numpy.float64), numpy.array(roots, dtype=numpy.int64)
+
+    # number of edges having the point strictly on the right side, edges ending at the point are skipped
+    def __rank(self, node, point, graph):
+        x = graph.xs[point]
+        y = graph.ys[point]
+        rank = 0
+
+        while node != -1:
+            edge = self.__node_edge[node]
+
+            if graph.edge_ends[edge] != point and graph.edge_direction(edge, x, y) == 1:
+                rank += self.__size(self.__node_left[node]) + 1
+                node = self.__node_right[node]
+            else:
+                node = self.__node_left[node]
+
+        return rank
+
+    def __new_node(self, edge, left=-1, right=-1, priority=None):
+        self.__node_edge.append(edge)
+        self.__node_left.append(left)
+        self.__node_right.append(right)
+        self.__node_priority.append(random.random() if priority is None else priority)
+        self.__node_size.append(1 + self.__size(left) + self.__size(right))
+
+        return len(self.__node_edge) - 1
+
+    def __copy(self, node, left, right):
+        return self.__new_node(self.__node_edge[node], left, right, self.__node_priority[node])
+
+    def __split(self, node, count):
+        if node == -1:
+            return -1, -1
+
+        left = self.__node_left[node]
+        right = self.__node_right[node]
+        left_size = self.__size(left)
+
+        if count <= left_size:
+            left_part, right_part = self.__split(left, count)
+
+            return left_part, self.__copy(node, right_part, right)
+
+        left_part, right_part = self.__split(right, count - left_size - 1)
+
+        return self.__copy(node, left, left_part), right_part
+
+    def __merge(self, left, right):
+        if left == -1:
+            return right
+
+        if right == -1:
+            return left
+
+        if self.__node_priority[left] > self.__node_priority[right]:
+            return self.__copy(left, self.__node_left[left], self.__merge(self.__node_right[left], right))
+
+        return self.__copy(right, self.__merge(left, self.__node_left[right]), self.__node_right[right])
+
+    def __size(self, node):
+        return 0 if node == -1 else self.__node_size[node]
+
+    def locate_many(self, points):
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        xs = points[:, 0]
+        ys = points[:, 1]
+
+        result = numpy.full((len(points), 2), ChainIndex.OUTSIDE, dtype=numpy.int64)
+
+        if self.chains_count == 0:
+            return result
+
+        idx = numpy.flatnonzero((ys >= self.slab_ys[0]) & (ys <= self.slab_ys[-1]))
+        slabs = numpy.maximum(numpy.searchsorted(self.slab_ys, ys[idx]) - 1, 0)
+        roots = self.roots[slabs]
+
+        # first edge not having the point strictly on the right and first edge having it on the left
+        touched, has_left = self.__descend(roots, xs[idx], ys[idx], lambda dirs: dirs != 1)
+        right, _ = self.__descend(roots, xs[idx], ys[idx], lambda dirs: dirs == -1)
+
+        inside = (touched != -1) & (has_left | (touched != right))
+        idx, touched, right = idx[inside], touched[inside], right[inside]
+
+        between = touched == right
+        result[idx[between], 0] = self.first_chain[right[between]] - 1
+        result[idx[between], 1] = self.first_chain[right[between]]
+
+        on_chain = ~between
+        first = self.first_chain[touched[on_chain]]
+        last = numpy.where(
+            right[on_chain] == -1,
+            self.chains_count - 1,
+            self.first_chain[right[on_chain]] - 1
+        )
+        probed = ChainIndex.first_probed(first, last, self.chains_count)
+        probed = numpy.where(probed != -1, probed, numpy.where(first == 0, 0, self.chains_count - 1))
+        result[idx[on_chain]] = probed[:, None]
+
+        return result
+
+    def __descend(self, nodes, xs, ys, goes_left):
+        nodes = nodes.copy()
+        found = numpy.full(len(nodes), -1, dtype=numpy.int64)
+        went_right = numpy.zeros(len(nodes), dtype=bool)
+
+        while True:
+            sel = numpy.flatnonzero(nodes != -1)
+
+            if len(sel) == 0:
+                break
+
+            edges = self.node_edge[nodes[sel]]
+            dirs = ChainIndex.edge_directions(
+                self.start_x[edges],
+                self.start_y[edges],
+                self.end_x[edges],
+                self.end_y[edges],
+                xs[sel],
+                ys[sel]
+            )
+
+            left = goes_left(dirs)
+            found[sel[left]] = edges[left]
+            went_right[sel[~left]] = True
+            nodes[sel] = numpy.where(left, self.node_left[nodes[sel]], self.node_right[nodes[sel]])
+
+        return found, went_right
@@ -0,0 +1,146 @@
+import random
+
+
+class Node:
+    def __init__(self, edge, point):
+        self.edge = edge
+        self.point = point  # the last swept point in the gap to the left of the edge
+        self.priority = random.random()
+        self.size = 1
+        self.left = None
+        self.right = None
+        self.parent = None
+
+
+# sequence of status edges ordered from left to right, stored in an implicit treap;
+# the rightmost node is a sentinel without an edge that keeps the rightmost gap
+class SweepStatus:
+    def __init__(self, edges, point, direction):
+        self.direction = direction  # side of the point relative to the edge: -1, 0 or 1
+        self.nodes = {}
+        self.root = Node(None, point)
+        self.replace(self.root, 0, edges, point)
+
+    def locate(self, point):
+        current = self.root
+        result = None
+
+        while current is not None:
+            if current.edge is None or self.direction(current.edge, point) != 1:
+                result = current
+                current = current.left
+            else:
+                current = current.right
+
+        return result
+
+    def node_of(self, edge):
+        return self.nodes[edge]
+
+    # replaces 'count' edges starting from 'node' by 'edges',
+    # all gaps around the inserted edges get 'point'
+    def replace(self, node, count, edges, point):
+        left, rest = self.__split(self.root, self.__rank(node))
+        removed, right = self.__split(rest, count)
+
+        self.__forget(removed)
+        self.__leftmost(right).point = point
+
+        inserted = None
+
+        for edge in edges:
+            to_insert = Node(edge, point)
+            self.nodes[edge] = to_insert
+            inserted = self.__merge(inserted, to_insert)
+
+        self.root = self.__merge(self.__merge(left, inserted), right)
+        self.root.parent = None
+
+    def __rank(self, node):
+        rank = SweepStatus.__size(node.left)
+
+        while node.parent is not None:
+            if node is node.parent.right:
+                rank += SweepStatus.__size(node.parent.left) + 1
+
+            node = node.parent
+
+        return rank
+
+    def __split(self, node, count):
+        if node is None:
+            return None, None
+
+        left_size = SweepStatus.__size(node.left)
+
+        if count <= left_size:
+            left, node.left = self.__split(node.left, count)
+            SweepStatus.__attach(node, node.left)
+            SweepStatus.__update(node)
+
+            if left is not None:
+                left.parent = None
+
+            return left, node
+
+        node.right, right = self.__split(node.right, count - left_size - 1)
+        SweepStatus.__attach(node, node.right)
+        SweepStatus.__update(node)
+
+        if right is not None:
+            right.parent = None
+
+        return node, right
+
+    def __merge(self, left, right):
+        if left is None:
+            return right
+
+        if right is None:
+            return left
+
+        if left.priority > right.priority:
+            left.right = self.__merge(left.right, right)
+            SweepStatus.__attach(left, left.right)
+            SweepStatus.__update(left)
+
+            return left
+
+        right.left = self.__merge(left, right.left)
+        SweepStatus.__attach(right, right.left)
+        SweepStatus.__update(right)
+
+        return right
+
+    def __forget(self, node):
+        stack = [node] if node is not None else []
+
+        while len(stack) > 0:
+            current = stack.pop()
+            del self.nodes[current.edge]
+
+            if current.left is not None:
+                stack.append(current.left)
+
+            if current.right is not None:
+                stack.append(current.right)
+
+    @staticmethod
+    def __leftmost(node):
+        while node.left is not None:
+            node = node.left
+
+        return node
+
+    @staticmethod
+    def __attach(parent, child):
+        if child is not None:
+            child.parent = parent
+
+    @staticmethod
+    def __update(node):
+        node.size = 1 + SweepStatus.__size(node.left) + SweepStatus.__size(node.right)
+
+    @staticmethod
+    def __size(node):
+        return 0 if node is None else node.size
@@ -0,0 +1,106 @@
+import itertools
+import os
+import tempfile
+import unittest
+import numpy
+from chain_index import ChainIndex
+from main import Graph, Point
+
+
+class InsertEdgeTest(unittest.TestCase):
+    SIZE = 5
+
+    # triangulation of a jittered SIZE x SIZE grid, 'dropped' edges are left out;
+    # returns the graph and the numbers the graph gave to the grid points
+    def make_graph(self, dropped=()):
+        rng = numpy.random.default_rng(0)
+        points = [
+            (i + rng.uniform(-0.2, 0.2), j + rng.uniform(-0.2, 0.2))
+            for j in range(InsertEdgeTest.SIZE) for i in range(InsertEdgeTest.SIZE)
+        ]
+        edges = []
+
+        for j in range(InsertEdgeTest.SIZE):
+            for i in range(InsertEdgeTest.SIZE):
+                k = j * InsertEdgeTest.SIZE + i
+
+                if i + 1 < InsertEdgeTest.SIZE:
+                    edges.append((k, k + 1))
+
+                if j + 1 < InsertEdgeTest.SIZE:
+                    edges.append((k, k + InsertEdgeTest.SIZE))
+
+                if i + 1 < InsertEdgeTest.SIZE and j + 1 < InsertEdgeTest.SIZE:
+                    edges.append((k, k + InsertEdgeTest.SIZE + 1) if (i + j) % 2 else (k + 1, k + InsertEdgeTest.SIZE))
+
+        edges = [edge for edge in edges if edge not in dropped]
+
+        with tempfile.TemporaryDirectory() as directory:
+            points_file = os.path.join(directory, "points.txt")
+            edges_file = os.path.join(directory, "edges.txt")
+            numpy.savetxt(points_file, points)
+            numpy.savetxt(edges_file, edges, fmt="%d")
+            graph = Graph(points_file, edges_file)
+
+        graph.build()
+        points = numpy.array(points)
+        ranks = numpy.empty(len(points), dtype=numpy.int64)
+        ranks[numpy.lexsort((points[:, 0], points[:, 1]))] = numpy.arange(len(points))
+
+        return graph, ranks
+
+    @staticmethod
+    def crosses(graph, first, second):
+        def orientation(a, b, c):
+            return numpy.sign((graph.xs[b] - graph.xs[a]) * (graph.ys[c] - graph.ys[a])
+                              - (graph.ys[b] - graph.ys[a]) * (graph.xs[c] - graph.xs[a]))
+
+        for start, end in zip(graph.edge_starts.tolist(), graph.edge_ends.tolist()):
+            if len({first, second, start, end}) == 4 \
+                    and orientation(first, second, start) * orientation(first, second, end) < 0 \
+                    and orientation(start, end, first) * orientation(start, end, second) < 0:
+                return True
+
+        return False
+
+    # both ends of 3 - 14 are in the same gap, the edge cuts the chains of the gap in between
+    def test_edge_crossing_chains_between_its_ends(self):
+        graph, _ = self.make_graph()
+        self.assertTrue(InsertEdgeTest.crosses(graph, 3, 14))
+
+        with self.assertRaisesRegex(ValueError, "Edge crosses the subdivision"):
+            graph.insert_edge(3, 14)
+
+    def test_no_crossing_edge_is_accepted(self):
+        graph, _ = self.make_graph()
+
+        for first, second in itertools.combinations(range(len(graph.xs)), 2):
+            if second in graph.edge_ends[graph.out_edges_of(first)] or not InsertEdgeTest.crosses(graph, first, second):
+                continue
+
+            with self.assertRaises(ValueError):
+                self.make_graph()[0].insert_edge(first, second)
+
+    def test_dropped_diagonal_is_inserted_back(self):
+        graph, ranks = self.make_graph(dropped=[(7, 11)])
+        graph.insert_edge(ranks[7], ranks[11])
+
+        points = numpy.random.default_rng(1).uniform(-0.5, InsertEdgeTest.SIZE - 0.5, (200, 2))
+        located = graph.locate_many(points)
+
+        for point, (low, high) in zip(points, located.tolist()):
+            chains = [chain.number for chain in graph.locate(Point(*point))]
+            self.assertEqual(chains, [] if low == -1 else sorted({low, high}))
+
+
+class ChainIndexTest(unittest.TestCase):
+    # the prefix is whole, the lengths table after it is cut
+    def test_truncated_lengths_table(self):
+        header, _ = ChainIndex.from_edges(*[numpy.zeros(0)] * 4, *[numpy.zeros(0, dtype=numpy.int64)] * 2).pack()
+
+        with self.assertRaisesRegex(ValueError, "Chain index is truncated"):
+            ChainIndex.from_buffer(header[:20])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import numpy
+
+
+# 2-d tree stored implicitly in flat arrays: node i has children 2 * i + 1 and 2 * i + 2,
+# node j of level l covers points[j * n // 2^l:(j + 1) * n // 2^l] of the permuted points
+class BucketTree:
+    def __init__(self, coords, bucket_size=32):
+        if bucket_size < 1:
+            raise ValueError("Bucket size must be positive")
+
+        coords = numpy.asarray(coords, dtype=numpy.float64).reshape(-1, 2)
+
+        self.count = len(coords)
+        self.bucket_size = bucket_size
+        self.depth = (max(-(-self.count // bucket_size), 1) - 1).bit_length()
+
+        nodes_count = (2 << self.depth) - 1
+        self.points = coords.copy()
+        self.permutation = numpy.arange(self.count)
+        self.box_min = numpy.full((nodes_count, 2), numpy.inf)
+        self.box_max = numpy.full((nodes_count, 2), -numpy.inf)
+
+        # the boxes prune the searches, so the levels only order the points, no split values are kept
+        BucketTree.partition(self.points, [self.permutation], self.count, 0, 0, self.depth)
+        BucketTree.bucket_boxes(self.box_min, self.box_max, self.points, self.points, self.count, 0, 0, self.depth)
+        BucketTree.merge_boxes(self.box_min, self.box_max, self.depth)
+
+    def node_range(self, level, j):
+        return BucketTree.node_bounds(self.count, level, j)
+
+    @staticmethod
+    def node_bounds(count, level, j):
+        return (j * count) >> level, ((j + 1) * count) >> level
+
+    # orders the subtree of node j of a level down to 'depth' around the medians of the node ranges,
+    # 'points' holds the points of that node only and the arrays of 'companions' are permuted along with it
+    @staticmethod
+    def partition(points, companions, count, level, j, depth):
+        begin, _ = BucketTree.node_bounds(count, level, j)
+
+        for sub_level in range(level, depth):
+            axis = sub_level % 2
+            shift = sub_level - level
+
+            for i in range(j << shift, (j + 1) << shift):
+                node_begin, node_end = BucketTree.node_bounds(count, sub_level, i)
+                mid = ((2 * i + 1) * count) >> (sub_level + 1)
+
+                if mid == node_end:
+                    continue
+
+                first = node_begin - begin
+                last = node_end - begin
+                order = numpy.argpartition(points[first:last, axis], mid - node_begin)
+
+                for array in [points] + companions:
+                    array[first:last] = array[first:last][order]
+
+    # boxes of the buckets under node j of a level, from the lower and the upper corners of its objects
+    # (the same array for points), which are ordered as 'partition' leaves them
+    @staticmethod
+    def bucket_boxes(box_min, box_max, lows, highs, count, level, j, depth):
+        begin, _ = BucketTree.node_bounds(count, level, j)
+        shift = depth - level
+        leaves = numpy.arange(j << shift, (j + 1) << shift)
+        begins, ends = BucketTree.node_bounds(count, depth, leaves)
+        filled = ends > begins
+        first_leaf = (1 << depth) - 1
+
+        if filled.any():
+            box_min[first_leaf + leaves[filled]] = numpy.minimum.reduceat(lows, begins[filled] - begin, axis=0)
+            box_max[first_leaf + leaves[filled]] = numpy.maximum.reduceat(highs, begins[filled] - begin, axis=0)
+
+    # boxes of the inner nodes from the boxes of the buckets, level by level upwards
+    @staticmethod
+    def merge_boxes(box_min, box_max, depth):
+        for level in range(depth - 1, -1, -1):
+            nodes = numpy.arange((1 << level) - 1, (2 << level) - 1)
+            box_min[nodes] = numpy.minimum(box_min[2 * nodes + 1], box_min[2 * nodes + 2])
+            box_max[nodes] = numpy.maximum(box_max[2 * nodes + 1], box_max[2 * nodes + 2])
+
+    # indices of the points inside the rectangle, in the input order of 'coords'
+    def search(self, range_to_search):
+        nodes = numpy.zeros(1, dtype=numpy.int64)
+        found = []
+
+        for level in range(self.depth + 1):
+            crossing, inside = BucketTree.classify(self.box_min[nodes], self.box_max[nodes], range_to_search)
+            partial = crossing & ~inside
+
+            j = nodes - ((1 << level) - 1)
+            found.append(BucketTree.positions(*self.node_range(level, j[inside])))
+
+            if level == self.depth:
+                # buckets are scanned as a whole
+                positions = BucketTree.positions(*self.node_range(level, j[partial]))
+                found.append(positions[BucketTree.contains(self.points[positions], range_to_search)])
+            else:
+                nodes = numpy.stack([2 * nodes[partial] + 1, 2 * nodes[partial] + 2], axis=1).ravel()
+
+        return self.permutation[numpy.concatenate(found)]
+
+    # the test of Rectangle.contains_point for an array of points
+    @staticmethod
+    def contains(points, range_to_search):
+        dx = points[:, 0] - range_to_search.vertex.x
+        dy = range_to_search.vertex.y - points[:, 1]
+
+        return (0 <= dx) & (dx <= range_to_search.width) & (0 <= dy) & (dy <= range_to_search.height)
+
+    # which boxes the rectangle reaches and which it holds whole, with the arithmetic of Rectangle.contains_point;
+    # its differences are monotone, so the corners of a box bound those of its points
+    @staticmethod
+    def classify(box_min, box_max, range_to_search):
+        vertex = range_to_search.vertex
+        dx_min = box_min[:, 0] - vertex.x
+        dx_max = box_max[:, 0] - vertex.x
+        dy_min = vertex.y - box_max[:, 1]
+        dy_max = vertex.y - box_min[:, 1]
+
+        crossing = (0 <= dx_max) & (dx_min <= range_to_search.width) \
+            & (0 <= dy_max) & (dy_min <= range_to_search.height)
+        inside = crossing & (0 <= dx_min) & (dx_max <= range_to_search.width) \
+            & (0 <= dy_min) & (dy_max <= range_to_search.height)
+
+        return crossing, inside
+
+    @staticmethod
+    def positions(begins, ends):
+        lengths = ends - begins
+        starts = numpy.repeat(begins - numpy.cumsum(lengths) + lengths, lengths)
+
+        return starts + numpy.arange(lengths.sum())
@@ -0,0 +1,326 @@
+import mmap
+import os
+import struct
+import tempfile
+import numpy
+from bucket_tree import BucketTree
+
+
+# the implicit bucket tree written to a file page by page: every node page holds a complete subtree of
+# 'block_height' levels (the boxes of its nodes in implicit order), every leaf page holds one bucket;
+# the reader maps the file, so a search reads only the pages of the nodes it visits
+class DiskTree:
+    MAGIC = b"KDTPAGES"
+    FORMAT_VERSION = 1
+    HEADER = struct.Struct("<8sIIQIII")
+    PAGE_SIZE = 4096
+    BOX_SIZE = 4  # min x, min y, max x, max y
+    POINT_SIZE = 3  # x, y and the index of the point
+    LEAVES_PER_WRITE = 1024
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.buffer) < DiskTree.HEADER.size:
+            raise ValueError("Tree file is truncated")
+
+        magic, version, page_size, count, depth, block_height, leaf_capacity = \
+            DiskTree.HEADER.unpack_from(self.buffer, 0)
+
+        if magic != DiskTree.MAGIC:
+            raise ValueError("Not a tree file")
+
+        if version != DiskTree.FORMAT_VERSION:
+            raise ValueError(f"Unsupported tree file version {version}, expected {DiskTree.FORMAT_VERSION}")
+
+        self.page_size = page_size
+        self.count = count
+        self.depth = depth
+        self.block_height = block_height
+        self.leaf_capacity = leaf_capacity
+
+        node_pages = DiskTree.__pages_before(depth // block_height + 1, block_height)
+        leaf_pages = 1 << depth
+        words = page_size // 8
+
+        if (1 + node_pages + leaf_pages) * page_size > len(self.buffer):
+            raise ValueError("Tree file is truncated")
+
+        # views of the mapped file, nothing is read until a page is indexed
+        nodes = numpy.frombuffer(self.buffer, dtype=numpy.float64, count=node_pages * words, offset=page_size)
+        self.boxes = nodes.reshape(node_pages, words)
+
+        leaves_offset = (1 + node_pages) * page_size
+        self.leaf_coords = numpy.frombuffer(
+            self.buffer, dtype=numpy.float64, count=leaf_pages * words, offset=leaves_offset
+        ).reshape(leaf_pages, words)
+        self.leaf_indices = numpy.frombuffer(
+            self.buffer, dtype=numpy.int64, count=leaf_pages * words, offset=leaves_offset
+        ).reshape(leaf_pages, words)
+
+    # the points are read from 'coords' (e.g. a numpy.memmap) a chunk at a time, see DiskTreeBuilder
+    @staticmethod
+    def build(coords, path, page_size=PAGE_SIZE):
+        if page_size % 8 != 0 or page_size < DiskTree.HEADER.size:
+            raise ValueError("Page size must be a multiple of 8 bytes and hold the header")
+
+        words = page_size // 8
+        leaf_capacity = words // DiskTree.POINT_SIZE
+        block_height = (words // DiskTree.BOX_SIZE + 1).bit_length() - 1
+        count = len(coords)
+        depth = (max(-(-count // leaf_capacity), 1) - 1).bit_length()
+        node_pages = DiskTree.__pages_before(depth // block_height + 1, block_height)
+
+        with open(path, "wb") as file:
+            header = DiskTree.HEADER.pack(
+                DiskTree.MAGIC,
+                DiskTree.FORMAT_VERSION,
+                page_size,
+                count,
+                depth,
+                block_height,
+                leaf_capacity
+            )
+            file.write(header.ljust(page_size, b"\0"))
+
+            # the leaf pages are written as their subtrees are built, the node pages once all boxes are known
+            builder = DiskTreeBuilder(coords, file, page_size, depth, (1 + node_pages) * page_size)
+            builder.build()
+
+            pages = numpy.zeros((node_pages, words), dtype=numpy.float64)
+
+            for level in range(depth + 1):
+                j = numpy.arange(1 << level)
+                page, slot = DiskTree.__node_slots(level, j, block_height)
+                nodes = (1 << level) - 1 + j
+                boxes = numpy.concatenate([builder.box_min[nodes], builder.box_max[nodes]], axis=1)
+                pages[page[:, None], slot[:, None] * DiskTree.BOX_SIZE + numpy.arange(DiskTree.BOX_SIZE)] = boxes
+
+            file.seek(page_size)
+            file.write(pages)
+
+    # indices of the points inside the rectangle, in the order of 'coords' given to 'build'
+    def search(self, range_to_search):
+        j = numpy.zeros(1, dtype=numpy.int64)
+        found = [numpy.zeros(0, dtype=numpy.int64)]
+
+        for level in range(self.depth + 1):
+            page, slot = DiskTree.__node_slots(level, j, self.block_height)
+            boxes = self.boxes[page[:, None], slot[:, None] * DiskTree.BOX_SIZE + numpy.arange(DiskTree.BOX_SIZE)]
+            crossing, inside = BucketTree.classify(boxes[:, :2], boxes[:, 2:], range_to_search)
+            partial = crossing & ~inside
+
+            # the leaves under a node are consecutive
+            shift = self.depth - level
+            leaves = BucketTree.positions(j[inside] << shift, (j[inside] + 1) << shift)
+            leaf, slot, _ = DiskTree.bucket_slots(self.count, self.depth, leaves)
+            found.append(self.leaf_indices[leaf, 2 * self.leaf_capacity + slot])
+
+            if level == self.depth:
+                leaf, slot, _ = DiskTree.bucket_slots(self.count, self.depth, j[partial])
+                points = numpy.stack([self.leaf_coords[leaf, 2 * slot], self.leaf_coords[leaf, 2 * slot + 1]], axis=1)
+                inside_points = BucketTree.contains(points, range_to_search)
+                found.append(self.leaf_indices[leaf, 2 * self.leaf_capacity + slot][inside_points])
+            else:
+                j = numpy.stack([2 * j[partial], 2 * j[partial] + 1], axis=1).ravel()
+
+        return numpy.concatenate(found)
+
+    def close(self):
+        del self.boxes, self.leaf_coords, self.leaf_indices
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # page and slot of the nodes j of a level, pages go block level by block level
+    @staticmethod
+    def __node_slots(level, j, block_height):
+        block_level = level // block_height
+        local_level = level - block_level * block_height
+        roots = j >> local_level
+
+        page = DiskTree.__pages_before(block_level, block_height) + roots
+        slot = (1 << local_level) - 1 + j - (roots << local_level)
+
+        return page, slot
+
+    @staticmethod
+    def __pages_before(block_level, block_height):
+        return ((1 << (block_level * block_height)) - 1) // ((1 << block_height) - 1)
+
+    # leaf page and slot of every point of the buckets, with its position in the bucket tree
+    @staticmethod
+    def bucket_slots(count, depth, leaves):
+        begins = (leaves * count) >> depth
+        ends = ((leaves + 1) * count) >> depth
+        positions = BucketTree.positions(begins, ends)
+        leaf = numpy.repeat(leaves, ends - begins)
+
+        return leaf, positions - numpy.repeat(begins, ends - begins), positions
+
+
+# the build of a tree file without the points in memory: a node too large for memory is partitioned around
+# its median from one scratch buffer on disk into the other a chunk at a time, a node that fits is read in,
+# its subtree is partitioned there and the leaf pages under it are written; the node ranges are the ones
+# of BucketTree, the boxes are kept for the node pages
+class DiskTreeBuilder:
+    MEMORY_POINTS = 1 << 22  # the largest subtree built in memory, also the points read at once
+    RADIX_BITS = 16
+    SCRATCH = numpy.dtype([("coords", numpy.float64, 2), ("index", numpy.int64)])
+
+    def __init__(self, coords, file, page_size, depth, leaves_offset):
+        self.coords = coords
+        self.file = file
+        self.page_size = page_size
+        self.leaf_capacity = page_size // 8 // DiskTree.POINT_SIZE
+        self.count = len(coords)
+        self.depth = depth
+        self.leaves_offset = leaves_offset
+
+        nodes_count = (2 << depth) - 1
+        self.box_min = numpy.full((nodes_count, 2), numpy.inf)
+        self.box_max = numpy.full((nodes_count, 2), -numpy.inf)
+
+    def build(self):
+        if self.count <= DiskTreeBuilder.MEMORY_POINTS or self.depth == 0:
+            coords = numpy.array(self.coords, dtype=numpy.float64).reshape(-1, 2)
+            self.__build_in_memory(coords, numpy.arange(self.count), 0, 0)
+        else:
+            with tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.file.name))) as scratch:
+                buffers = numpy.memmap(scratch, dtype=DiskTreeBuilder.SCRATCH, mode="w+", shape=(2, self.count))
+
+                for first in range(0, self.count, DiskTreeBuilder.MEMORY_POINTS):
+                    last = min(first + DiskTreeBuilder.MEMORY_POINTS, self.count)
+                    buffers[0, first:last]["coords"] = self.coords[first:last]
+                    buffers[0, first:last]["index"] = numpy.arange(first, last)
+
+                self.__build_on_disk(buffers)
+                del buffers
+
+        BucketTree.merge_boxes(self.box_min, self.box_max, self.depth)
+
+    # the large nodes of a level are in buffers[level % 2], their children go to the other buffer
+    def __build_on_disk(self, buffers):
+        large = [0]
+
+        for level in range(self.depth):
+            source = buffers[level % 2]
+            target = buffers[1 - level % 2]
+            next_large = []
+
+            for j in large:
+                begin, end = BucketTree.node_bounds(self.count, level, j)
+                mid = ((2 * j + 1) * self.count) >> (level + 1)
+                self.__partition(source, target, begin, end, mid, level % 2)
+
+                for child in [2 * j, 2 * j + 1]:
+                    child_begin, child_end = BucketTree.node_bounds(self.count, level + 1, child)
+
+                    if child_end - child_begin <= DiskTreeBuilder.MEMORY_POINTS or level + 1 == self.depth:
+                        points = numpy.array(target[child_begin:child_end])
+                        self.__build_in_memory(points["coords"], points["index"], level + 1, child)
+                    else:
+                        next_large.append(child)
+
+            large = next_large
+
+    # the subtree of node j of a level from its points, the same partitions as BucketTree
+    def __build_in_memory(self, coords, indices, level, j):
+        begin, _ = BucketTree.node_bounds(self.count, level, j)
+        BucketTree.partition(coords, [indices], self.count, level, j, self.depth)
+        BucketTree.bucket_boxes(self.box_min, self.box_max, coords, coords, self.count, level, j, self.depth)
+
+        shift = self.depth - level
+        leaves = numpy.arange(j << shift, (j + 1) << shift)
+
+        for first in range(leaves[0], leaves[-1] + 1, DiskTree.LEAVES_PER_WRITE):
+            batch = numpy.arange(first, min(first + DiskTree.LEAVES_PER_WRITE, leaves[-1] + 1))
+            leaf, slot, positions = DiskTree.bucket_slots(self.count, self.depth, batch)
+
+            pages = numpy.zeros((len(batch), self.page_size // 8), dtype=numpy.float64)
+            pages[leaf - first, 2 * slot] = coords[positions - begin, 0]
+            pages[leaf - first, 2 * slot + 1] = coords[positions - begin, 1]
+            pages.view(numpy.int64)[leaf - first, 2 * self.leaf_capacity + slot] = indices[positions - begin]
+
+            self.file.seek(self.leaves_offset + int(first) * self.page_size)
+            self.file.write(pages)
+
+    # moves the points begin .. end - 1 from 'source' to 'target', the mid - begin lowest on 'axis' first
+    def __partition(self, source, target, begin, end, mid, axis):
+        value, below = self.__select(source, begin, end, axis, mid - begin)
+        equal_left = mid - begin - below
+        left = begin
+        right = mid
+
+        for first in range(begin, end, DiskTreeBuilder.MEMORY_POINTS):
+            chunk = numpy.array(source[first:min(first + DiskTreeBuilder.MEMORY_POINTS, end)])
+            values = chunk["coords"][:, axis]
+
+            goes_left = values < value
+            equal = numpy.flatnonzero(values == value)[:equal_left]
+            goes_left[equal] = True
+            equal_left -= len(equal)
+
+            lows = chunk[goes_left]
+            highs = chunk[~goes_left]
+            target[left:left + len(lows)] = lows
+            target[right:right + len(highs)] = highs
+            left += len(lows)
+            right += len(highs)
+
+    # the value of rank k on 'axis' among the points begin .. end - 1 and how many points are below it:
+    # every pass fixes one more digit of the order-preserving integer keys of the values, until the points
+    # with the fixed digits fit in memory
+    def __select(self, source, begin, end, axis, k):
+        prefix = 0
+        bits = 0
+        below = 0
+        candidates = end - begin
+        digits = 1 << DiskTreeBuilder.RADIX_BITS
+
+        while candidates > DiskTreeBuilder.MEMORY_POINTS and bits < 64:
+            shift = numpy.uint64(64 - bits - DiskTreeBuilder.RADIX_BITS)
+            histogram = numpy.zeros(digits, dtype=numpy.int64)
+
+            for keys in self.__keys(source, begin, end, axis, prefix, bits):
+                histogram += numpy.bincount((keys >> shift) & numpy.uint64(digits - 1), minlength=digits)
+
+            counts = numpy.cumsum(histogram)
+            digit = int(numpy.searchsorted(counts, k - below, side="right"))
+            below += int(counts[digit] - histogram[digit])
+            candidates = int(histogram[digit])
+            prefix = (prefix << DiskTreeBuilder.RADIX_BITS) | digit
+            bits += DiskTreeBuilder.RADIX_BITS
+
+        if bits == 64:
+            return DiskTreeBuilder.__value(prefix), below
+
+        keys = numpy.concatenate(list(self.__keys(source, begin, end, axis, prefix, bits)))
+        key = numpy.partition(keys, k - below)[k - below]
+
+        return DiskTreeBuilder.__value(key), below + int((keys < key).sum())
+
+    # keys of the values with the leading 'bits' bits equal to 'prefix', a chunk at a time
+    def __keys(self, source, begin, end, axis, prefix, bits):
+        for first in range(begin, end, DiskTreeBuilder.MEMORY_POINTS):
+            values = source[first:min(first + DiskTreeBuilder.MEMORY_POINTS, end)]["coords"][:, axis]
+            # adding zero turns -0.0 into 0.0, the keys of equal values are equal
+            keys = numpy.ascontiguousarray(values + 0.0).view(numpy.uint64)
+            keys = numpy.where(keys >> numpy.uint64(63) == 1, ~keys, keys | numpy.uint64(1 << 63))
+
+            if bits > 0:
+                keys = keys[keys >> numpy.uint64(64 - bits) == numpy.uint64(prefix)]
+
+            yield keys
+
+    @staticmethod
+    def __value(key):
+        key = numpy.uint64(key)
+        bits = key & ~numpy.uint64(1 << 63) if key >> numpy.uint64(63) == 1 else ~key
+
+        return float(numpy.array([bits]).view(numpy.float64)[0])
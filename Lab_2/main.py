@@ -1,4 +1,22 @@
+import heapq
+import math
 import matplotlib.pyplot as plt
+import numpy
+from enum import Enum
+from parallel_partition import ParallelPartition
+from range_tree import RangeTree
+
+
+# the range tree takes O(n log n) memory for O(log n + k) queries
+class Engine(Enum):
+    KD_TREE = 1
+    RANGE_TREE = 2
+
+
+class Strategy(Enum):
+    TREE = 1  # the tree search, for small results
+    SCAN = 2  # one vectorized test of all the points
+    HYBRID = 3  # the tree down to small or covered subtrees, those are scanned or taken whole
 
 
 class Point:
@@ -48,69 +66,853 @@ class Rectangle:
 
 
 class Node:
-    def __init__(self, point, line, axis, left=None, right=None):
+    def __init__(self, point, line, axis, left=None, right=None, index=None):
         self.point = point
         self.line = line
         self.axis = axis
         self.left = left
         self.right = right
+        self.parent = None
+        self.index = index  # position of the point in the input list
+        self.box = None  # (min x, min y, max x, max y) of the points in the subtree
+        self.summary = None  # weights of the points in the subtree
+        self.size = 1  # nodes in the subtree, deleted ones too
+        self.deleted = False
+
+        for child in [left, right]:
+            if child is not None:
+                child.parent = self
 
     def is_leaf(self):
         return self.left is None and self.right is None
 
 
-# 2-d tree
-class Tree:
-    def __init__(self, points):
-        self.root = self.__build_tree(points, 0)
+class Summary:
+    def __init__(self, count=0, total=0.0, minimum=float("inf"), maximum=float("-inf")):
+        self.count = count
+        self.total = total
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def add(self, weight):
+        self.merge(Summary(1, weight, weight, weight))
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+
+# what Tree.planned_search chose for a rectangle
+class Plan:
+    def __init__(self, strategy, estimate, count):
+        self.strategy = strategy
+        self.estimate = estimate  # expected number of points inside the rectangle
+        self.count = count  # points in the tree
+
+    def __str__(self):
+        return f"{self.strategy.name}: ~{self.estimate:.0f} of {self.count} points"
 
-    def __build_tree(self, points, depth):
-        if len(points) == 0:
+
+# 2-d tree, kept balanced under updates as a scapegoat tree: a too deep insertion rebuilds
+# the highest unbalanced subtree, deleted nodes stay until they are half of the tree;
+# the slots of the points a rebuild drops are given to later insertions, so the storage doesn't grow with churn
+class Tree:
+    BALANCE = 0.75
+    EMPTY_BOX = (float("inf"), float("inf"), float("-inf"), float("-inf"))
+    PARALLEL_MIN_POINTS = 1 << 16
+
+    # the planner: the levels the estimate looks at, the selectivities at which the tree search
+    # stops paying off and at which even the hybrid search does, the subtrees the hybrid search scans
+    ESTIMATE_DEPTH = 8
+    TREE_SELECTIVITY = 0.01
+    SCAN_SELECTIVITY = 0.25
+    HYBRID_SCAN_SIZE = 256
+
+    # 'processes' > 1 (None for all cores) builds the subtrees in a process pool, the tree is the same
+    def __init__(self, points, weights=None, processes=1):
+        self.points = list(points)
+        # 'coords' and 'weights' are views of the buffers, the buffers double when they are full
+        self.coord_buffer = numpy.array([(point.x, point.y) for point in points], dtype=numpy.float64).reshape(-1, 2)
+        self.weight_buffer = numpy.ones(len(points)) if weights is None else numpy.array(weights, dtype=numpy.float64)
+        self.coords = self.coord_buffer
+        self.weights = self.weight_buffer
+
+        if len(self.weights) != len(points):
+            raise ValueError("Expected one weight per point")
+
+        self.deleted_count = 0
+        self.free_slots = []  # indices of the points a rebuild dropped, 'insert' takes them first
+        self.nodes = [None] * len(points)  # node of every point, 'delete' walks up from it
+        order = numpy.arange(len(points))
+
+        if processes != 1 and len(points) >= Tree.PARALLEL_MIN_POINTS:
+            payload = ParallelPartition(self.coords, self.weights, processes).build(order)
+            self.root = self.__stitch(order, payload)
+        else:
+            self.root = self.__build_tree(order, 0)
+
+        self.node_points = None
+        self.last_plan = None
+
+    # 'order' is a view of one index array, each level only partitions it in place around the median
+    def __build_tree(self, order, depth):
+        if len(order) == 0:
             return None
 
         axis = depth % 2
 
-        points.sort(key=lambda p: p.get_coord_by_axis(axis))
-        mid_idx = len(points) // 2
-        median = points[mid_idx].get_coord_by_axis(axis)
+        mid_idx = len(order) // 2
+        order[:] = order[numpy.argpartition(self.coords[order, axis], mid_idx)]
+
+        index = order[mid_idx]
+        median = self.points[index].get_coord_by_axis(axis)
 
-        return Node(
-            points[mid_idx],
+        node = Node(
+            self.points[index],
             median,
             axis,
-            self.__build_tree(points[:mid_idx], depth + 1),
-            self.__build_tree(points[mid_idx + 1:], depth + 1)
+            self.__build_tree(order[:mid_idx], depth + 1),
+            self.__build_tree(order[mid_idx + 1:], depth + 1),
+            int(index)
         )
+        self.nodes[index] = node
+        self.__refresh(node)
+
+        return node
+
+    # the nodes of the order ParallelPartition left, with the payload its workers computed:
+    # they are made slot by slot and linked through the child slots, none of them is refreshed
+    def __stitch(self, order, payload):
+        boxes, summaries, sizes, axes, lefts, rights = [array.tolist() for array in payload]
+        nodes = [
+            Node(self.points[index], self.points[index].get_coord_by_axis(axis), axis, index=index)
+            for index, axis in zip(order.tolist(), axes)
+        ]
+
+        for node, box, summary, size, left, right in zip(nodes, boxes, summaries, sizes, lefts, rights):
+            node.left = nodes[left] if left != -1 else None
+            node.right = nodes[right] if right != -1 else None
+            self.nodes[node.index] = node
+
+            for child in [node.left, node.right]:
+                if child is not None:
+                    child.parent = node
+            node.box = tuple(box)
+            node.summary = Summary(size, *summary)
+            node.size = size
+
+        return nodes[len(nodes) // 2] if len(nodes) > 0 else None
+
+    # recomputes the size, the box and the summary of a node from its children
+    def __refresh(self, node):
+        node.size = 1
+        node.box = Tree.EMPTY_BOX
+        node.summary = Summary()
+
+        if not node.deleted:
+            x, y = self.coords[node.index].tolist()
+            node.box = (x, y, x, y)
+            node.summary.add(float(self.weights[node.index]))
+
+        for child in [node.left, node.right]:
+            if child is not None:
+                node.size += child.size
+                node.box = Tree.__union(node.box, child.box)
+                node.summary.merge(child.summary)
+
+    def insert(self, point, weight=1.0):
+        index = self.__store(point, weight)
+
+        path = []
+        node = self.root
+
+        while node is not None:
+            path.append(node)
+            node = node.left if point.get_coord_by_axis(node.axis) < node.line else node.right
+
+        axis = len(path) % 2
+        leaf = Node(point, point.get_coord_by_axis(axis), axis, index=index)
+        self.nodes[index] = leaf
+        self.__refresh(leaf)
+
+        if len(path) == 0:
+            self.root = leaf
+        elif point.get_coord_by_axis(path[-1].axis) < path[-1].line:
+            path[-1].left = leaf
+        else:
+            path[-1].right = leaf
+
+        leaf.parent = path[-1] if len(path) > 0 else None
+
+        for node in path:
+            node.size += 1
+            node.box = Tree.__union(node.box, leaf.box)
+            node.summary.merge(leaf.summary)
+
+        path.append(leaf)
+
+        if len(path) - 1 > math.log(self.root.size) / math.log(1 / Tree.BALANCE):
+            for depth in range(len(path) - 2, -1, -1):
+                if path[depth + 1].size > Tree.BALANCE * path[depth].size:
+                    self.__rebuild(path, depth)
+                    break
+
+        self.node_points = None
+
+        return index
+
+    def delete(self, index):
+        path = self.__path_to(index)
+
+        if path is None:
+            raise ValueError("Point is not in the tree")
+
+        path[-1].deleted = True
+        self.deleted_count += 1
+
+        for node in reversed(path):
+            self.__refresh(node)
+
+        if self.deleted_count > self.root.summary.count:
+            self.__rebuild([self.root], 0)
+
+        self.node_points = None
+
+    # nodes from the root to the live node of the point; points on a line may be on both sides of it,
+    # so the path is walked up from the node of the point
+    def __path_to(self, index):
+        if not 0 <= index < len(self.nodes) or self.nodes[index] is None or self.nodes[index].deleted:
+            return None
+
+        path = []
+        node = self.nodes[index]
+
+        while node is not None:
+            path.append(node)
+            node = node.parent
+
+        return path[::-1]
+
+    # rebuilds the subtree of path[depth] from its live points
+    def __rebuild(self, path, depth):
+        node = path[depth]
+        live = []
+        stack = [node]
+
+        while len(stack) > 0:
+            current = stack.pop()
+
+            if current is not None:
+                if current.deleted:
+                    self.__free(current.index)
+                else:
+                    live.append(current.index)
+
+                stack.extend([current.left, current.right])
+
+        self.deleted_count -= node.size - len(live)
+        self.__replace_child(path, depth, self.__build_tree(numpy.array(live, dtype=numpy.int64), depth))
+
+        for ancestor in reversed(path[:depth]):
+            self.__refresh(ancestor)
+
+    # puts 'node' in place of path[depth]
+    def __replace_child(self, path, depth, node):
+        if node is not None:
+            node.parent = path[depth - 1] if depth > 0 else None
+
+        if depth == 0:
+            self.root = node
+        elif path[depth - 1].left is path[depth]:
+            path[depth - 1].left = node
+        else:
+            path[depth - 1].right = node
+
+    # no node refers to a dropped point any more, so its slot can take a new one
+    def __free(self, index):
+        self.points[index] = None
+        self.nodes[index] = None
+        self.free_slots.append(index)
+
+    # the slot of a new point: a freed one, or a new one at the end of the buffers
+    def __store(self, point, weight):
+        if len(self.free_slots) == 0:
+            self.__append(point, weight)
+
+            return len(self.points) - 1
+
+        index = self.free_slots.pop()
+        self.points[index] = point
+        self.coord_buffer[index] = (point.x, point.y)
+        self.weight_buffer[index] = weight
+
+        return index
+
+    def __append(self, point, weight):
+        count = len(self.points)
+
+        if count == len(self.coord_buffer):
+            capacity = max(2 * count, 1)
+            self.coord_buffer = numpy.resize(self.coord_buffer, (capacity, 2))
+            self.weight_buffer = numpy.resize(self.weight_buffer, capacity)
+
+        self.points.append(point)
+        self.nodes.append(None)
+        self.coord_buffer[count] = (point.x, point.y)
+        self.weight_buffer[count] = weight
+        self.coords = self.coord_buffer[:count + 1]
+        self.weights = self.weight_buffer[:count + 1]
+
+    @staticmethod
+    def __union(box, other):
+        return min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3])
+
+    # the nodes in flat arrays for the batched searches, in preorder so that the subtree of node i
+    # is nodes i .. i + size - 1; -1 is a missing child
+    def __flatten(self):
+        nodes = []
+        stack = [self.root]
+
+        while len(stack) > 0:
+            node = stack.pop()
+
+            if node is not None:
+                nodes.append(node)
+                stack.extend([node.right, node.left])
+
+        sizes = [node.size for node in nodes]
+        lefts = [i + 1 if node.left is not None else -1 for i, node in enumerate(nodes)]
+        rights = [
+            i + 1 + (node.left.size if node.left is not None else 0) if node.right is not None else -1
+            for i, node in enumerate(nodes)
+        ]
+
+        self.node_points = numpy.array([node.index for node in nodes], dtype=numpy.int64)
+        self.node_lines = numpy.array([node.line for node in nodes], dtype=numpy.float64)
+        self.node_axes = numpy.array([node.axis for node in nodes], dtype=numpy.int64)
+        self.node_lefts = numpy.array(lefts, dtype=numpy.int64)
+        self.node_rights = numpy.array(rights, dtype=numpy.int64)
+        self.node_boxes = numpy.array([node.box for node in nodes], dtype=numpy.float64).reshape(-1, 4)
+        self.node_alive = numpy.array([not node.deleted for node in nodes], dtype=bool)
+        self.node_sizes = numpy.array(sizes, dtype=numpy.int64)
 
     def search(self, range_to_search):
+        return list(self.iter_search(range_to_search))
+
+    # explicit-stack search yielding the points lazily (lists of 'chunk_size' points if it's given),
+    # it stops after 'limit' points or once 'cancel' (e.g. a threading.Event) is set
+    def iter_search(self, range_to_search, limit=None, chunk_size=None, cancel=None):
+        stack = [self.root]
+        chunk = []
+        found = 0
+
+        while len(stack) > 0 and (limit is None or found < limit):
+            if cancel is not None and cancel.is_set():
+                break
+
+            node = stack.pop()
+
+            if node is None:
+                continue
+
+            if not node.deleted and range_to_search.contains_point(node.point):
+                found += 1
+
+                if chunk_size is None:
+                    yield node.point
+                else:
+                    chunk.append(node.point)
+
+                    if len(chunk) == chunk_size:
+                        yield chunk
+                        chunk = []
+
+            goes_left, goes_right = Tree.__sides(range_to_search, node.axis, node.line)
+
+            # the left subtree goes on top to keep the order of the recursive search
+            if goes_right:
+                stack.append(node.right)
+
+            if goes_left:
+                stack.append(node.left)
+
+        if len(chunk) > 0:
+            yield chunk
+
+    # all rectangles go down the tree together one level at a time, at each node the batch is split
+    # between the children; the points found for rectangle i are indices[offsets[i]:offsets[i + 1]]
+    def search_many(self, ranges):
+        if self.node_points is None:
+            self.__flatten()
+
+        vertices_x = numpy.array([range_to_search.vertex.x for range_to_search in ranges], dtype=numpy.float64)
+        vertices_y = numpy.array([range_to_search.vertex.y for range_to_search in ranges], dtype=numpy.float64)
+        widths = numpy.array([range_to_search.width for range_to_search in ranges], dtype=numpy.float64)
+        heights = numpy.array([range_to_search.height for range_to_search in ranges], dtype=numpy.float64)
+
+        found_ranges = [numpy.zeros(0, dtype=numpy.int64)]
+        found_points = [numpy.zeros(0, dtype=numpy.int64)]
+        batch = numpy.arange(len(ranges)) if self.root is not None else numpy.zeros(0, dtype=numpy.int64)
+        nodes = numpy.zeros(len(batch), dtype=numpy.int64)
+
+        while len(nodes) > 0:
+            points = self.node_points[nodes]
+
+            # the same test as Rectangle.contains_point
+            dx = self.coords[points, 0] - vertices_x[batch]
+            dy = vertices_y[batch] - self.coords[points, 1]
+            contains = (0 <= dx) & (dx <= widths[batch]) & (0 <= dy) & (dy <= heights[batch]) & self.node_alive[nodes]
+
+            found_ranges.append(batch[contains])
+            found_points.append(points[contains])
+
+            # the same tests as Tree.__sides
+            on_x = self.node_axes[nodes] == 0
+            lines = self.node_lines[nodes]
+            go_left = numpy.where(on_x, vertices_x[batch] <= lines, vertices_y[batch] - lines <= heights[batch])
+            go_right = numpy.where(on_x, lines - vertices_x[batch] <= widths[batch], lines <= vertices_y[batch])
+            go_left &= self.node_lefts[nodes] != -1
+            go_right &= self.node_rights[nodes] != -1
+
+            nodes = numpy.concatenate([self.node_lefts[nodes[go_left]], self.node_rights[nodes[go_right]]])
+            batch = numpy.concatenate([batch[go_left], batch[go_right]])
+
+        found_ranges = numpy.concatenate(found_ranges)
+        found_points = numpy.concatenate(found_points)
+        order = numpy.argsort(found_ranges, kind="stable")
+
+        offsets = numpy.zeros(len(ranges) + 1, dtype=numpy.int64)
+        offsets[1:] = numpy.cumsum(numpy.bincount(found_ranges, minlength=len(ranges)))
+
+        return offsets, found_points[order]
+
+    # k nearest points ordered by distance, equally distant points by their position in the input list
+    def nearest(self, point, k=1):
+        indices, _ = self.__nearest(point.x, point.y, k)
+
+        return [self.points[i] for i in indices]
+
+    # for every query point: indices of its k nearest points and the distances to them, as 'nearest' gives them,
+    # rows are padded with -1 and inf when the tree has fewer than k points; the queries go down together
+    # to a subtree on their side with k live points, its k-th nearest point bounds the distance of the query,
+    # then the points within the bounds are collected as in 'within_radius_many'
+    def nearest_many(self, points, k=1):
+        if k < 1:
+            raise ValueError("k must be positive")
+
+        if self.node_points is None:
+            self.__flatten()
+
+        xs = numpy.array([point.x for point in points], dtype=numpy.float64)
+        ys = numpy.array([point.y for point in points], dtype=numpy.float64)
+        indices = numpy.full((len(points), k), -1, dtype=numpy.int64)
+        distances = numpy.full((len(points), k), numpy.inf)
+
+        if self.root is None:
+            return indices, distances
+
+        queries, found = self.__within_bounds(xs, ys, self.__nearest_bounds(xs, ys, k))
+        squared = Tree.__squared_distance(self.coords[found, 0], self.coords[found, 1], xs[queries], ys[queries])
+
+        # equally distant points by their index, as in 'nearest'
+        order = numpy.lexsort((found, squared, queries))
+        queries = queries[order]
+        counts = numpy.bincount(queries, minlength=len(points))
+        ranks = numpy.arange(len(queries)) - (numpy.cumsum(counts) - counts)[queries]
+        best = ranks < k
+
+        indices[queries[best], ranks[best]] = found[order][best]
+        distances[queries[best], ranks[best]] = numpy.sqrt(squared[order][best])
+
+        return indices, distances
+
+    # squared distance to the k-th nearest point of a subtree with k live points, inf if the tree has fewer
+    def __nearest_bounds(self, xs, ys, k):
+        live = numpy.concatenate([[0], numpy.cumsum(self.node_alive)])
+        nodes = numpy.zeros(len(xs), dtype=numpy.int64)
+        batch = numpy.arange(len(xs))
+
+        # down to the child on the side of the point while it has k live points
+        while len(batch) > 0:
+            current = nodes[batch]
+            coords = numpy.where(self.node_axes[current] == 0, xs[batch], ys[batch])
+            lefts = self.node_lefts[current]
+            children = numpy.where(coords < self.node_lines[current], lefts, self.node_rights[current])
+
+            deeper = children != -1
+            ends = children[deeper] + self.node_sizes[children[deeper]]
+            deeper[deeper] = live[ends] - live[children[deeper]] >= k
+
+            nodes[batch[deeper]] = children[deeper]
+            batch = batch[deeper]
+
+        sizes = self.node_sizes[nodes]
+        queries = numpy.repeat(numpy.arange(len(xs)), sizes)
+        # the subtree of node i is nodes i .. i + size - 1
+        slots = numpy.repeat(nodes - numpy.cumsum(sizes) + sizes, sizes) + numpy.arange(sizes.sum())
+        alive = self.node_alive[slots]
+        queries = queries[alive]
+        found = self.node_points[slots[alive]]
+
+        squared = Tree.__squared_distance(self.coords[found, 0], self.coords[found, 1], xs[queries], ys[queries])
+        squared = squared[numpy.lexsort((squared, queries))]
+        counts = numpy.bincount(queries, minlength=len(xs))
+
+        bounds = numpy.full(len(xs), numpy.inf)
+        enough = counts >= k
+        bounds[enough] = squared[(numpy.cumsum(counts) - counts)[enough] + k - 1]
+
+        return bounds
+
+    # bounded max-heap of the k best candidates, subtrees whose box is farther than the worst one are skipped
+    def __nearest(self, x, y, k):
+        if k < 1:
+            raise ValueError("k must be positive")
+
+        heap = []  # (-squared distance, -index), the worst candidate is on top
+        stack = [self.root]
+
+        while len(stack) > 0:
+            node = stack.pop()
+
+            if node is None or (len(heap) == k and Tree.__box_distance(node.box, x, y) > -heap[0][0]):
+                continue
+
+            if not node.deleted:
+                candidate = (-Tree.__squared_distance(node.point.x, node.point.y, x, y), -node.index)
+
+                if len(heap) < k:
+                    heapq.heappush(heap, candidate)
+                elif candidate > heap[0]:
+                    heapq.heapreplace(heap, candidate)
+
+            # the child on the side of the point is visited first
+            if (x if node.axis == 0 else y) < node.line:
+                stack.extend([node.right, node.left])
+            else:
+                stack.extend([node.left, node.right])
+
+        best = sorted((-distance, -index) for distance, index in heap)
+
+        return [index for _, index in best], [math.sqrt(distance) for distance, _ in best]
+
+    def within_radius(self, point, radius):
         result = []
-        self.__search(self.root, range_to_search, result)
+        stack = [self.root]
+
+        while len(stack) > 0:
+            node = stack.pop()
+
+            if node is None or Tree.__box_distance(node.box, point.x, point.y) > radius * radius:
+                continue
+
+            if not node.deleted \
+                    and Tree.__squared_distance(node.point.x, node.point.y, point.x, point.y) <= radius * radius:
+                result.append(node.point)
+
+            stack.extend([node.right, node.left])
 
         return result
 
-    def __search(self, node, range_to_search, output):
-        if node is None:
+    # like 'search_many': all the query points go down the tree together,
+    # the points found for query i are indices[offsets[i]:offsets[i + 1]]
+    def within_radius_many(self, points, radius):
+        if self.node_points is None:
+            self.__flatten()
+
+        xs = numpy.array([point.x for point in points], dtype=numpy.float64)
+        ys = numpy.array([point.y for point in points], dtype=numpy.float64)
+        squared_radii = numpy.broadcast_to(numpy.asarray(radius, dtype=numpy.float64) ** 2, xs.shape)
+
+        found_queries, found_points = self.__within_bounds(xs, ys, squared_radii)
+        order = numpy.argsort(found_queries, kind="stable")
+
+        offsets = numpy.zeros(len(points) + 1, dtype=numpy.int64)
+        offsets[1:] = numpy.cumsum(numpy.bincount(found_queries, minlength=len(points)))
+
+        return offsets, found_points[order]
+
+    # (query, point index) pairs of the live points within the squared distance bound of every query
+    def __within_bounds(self, xs, ys, squared_radii):
+        found_queries = [numpy.zeros(0, dtype=numpy.int64)]
+        found_points = [numpy.zeros(0, dtype=numpy.int64)]
+        batch = numpy.arange(len(xs)) if self.root is not None else numpy.zeros(0, dtype=numpy.int64)
+        nodes = numpy.zeros(len(batch), dtype=numpy.int64)
+
+        while len(nodes) > 0:
+            boxes = self.node_boxes[nodes]
+            dx = numpy.maximum(numpy.maximum(boxes[:, 0] - xs[batch], xs[batch] - boxes[:, 2]), 0)
+            dy = numpy.maximum(numpy.maximum(boxes[:, 1] - ys[batch], ys[batch] - boxes[:, 3]), 0)
+            near = dx * dx + dy * dy <= squared_radii[batch]
+            nodes = nodes[near]
+            batch = batch[near]
+
+            points_of_nodes = self.node_points[nodes]
+            dx = self.coords[points_of_nodes, 0] - xs[batch]
+            dy = self.coords[points_of_nodes, 1] - ys[batch]
+            inside = (dx * dx + dy * dy <= squared_radii[batch]) & self.node_alive[nodes]
+
+            found_queries.append(batch[inside])
+            found_points.append(points_of_nodes[inside])
+
+            lefts = self.node_lefts[nodes]
+            rights = self.node_rights[nodes]
+            nodes = numpy.concatenate([lefts[lefts != -1], rights[rights != -1]])
+            batch = numpy.concatenate([batch[lefts != -1], batch[rights != -1]])
+
+        return numpy.concatenate(found_queries), numpy.concatenate(found_points)
+
+    # of scalars or of arrays, with products: a float ** 2 goes through pow, which isn't always rounded as x * x
+    @staticmethod
+    def __squared_distance(x_1, y_1, x_2, y_2):
+        dx = x_1 - x_2
+        dy = y_1 - y_2
+
+        return dx * dx + dy * dy
+
+    @staticmethod
+    def __box_distance(box, x, y):
+        dx = max(box[0] - x, 0, x - box[2])
+        dy = max(box[1] - y, 0, y - box[3])
+
+        return dx * dx + dy * dy
+
+    # count, sum, min and max of the weights of the points inside the rectangle
+    def aggregate(self, range_to_search):
+        result = Summary()
+        self.__aggregate(self.root, range_to_search, result)
+
+        return result
+
+    def __aggregate(self, node, range_to_search, output):
+        if node is None or Tree.__misses(node.box, range_to_search):
+            return
+
+        if Tree.__covers(node.box, range_to_search):
+            output.merge(node.summary)
             return
 
-        left, right = range_to_search.get_range_by_axis(node.axis)
+        if not node.deleted and range_to_search.contains_point(node.point):
+            output.add(float(self.weights[node.index]))
+
+        goes_left, goes_right = Tree.__sides(range_to_search, node.axis, node.line)
+
+        if goes_left:
+            self.__aggregate(node.left, range_to_search, output)
+
+        if goes_right:
+            self.__aggregate(node.right, range_to_search, output)
+
+    # the rectangle test is monotone, so a box with both corners inside is inside
+    @staticmethod
+    def __covers(box, range_to_search):
+        x_min, y_min, x_max, y_max = box
+
+        return range_to_search.contains_point(Point(x_min, y_max)) \
+            and range_to_search.contains_point(Point(x_max, y_min))
+
+    # whether the rectangle reaches the points on the left and on the right of a line,
+    # with the arithmetic of Rectangle.contains_point
+    @staticmethod
+    def __sides(range_to_search, axis, line):
+        vertex = range_to_search.vertex
+
+        if axis == 0:
+            return vertex.x <= line, line - vertex.x <= range_to_search.width
+
+        return vertex.y - line <= range_to_search.height, line <= vertex.y
+
+    @staticmethod
+    def __misses(box, range_to_search):
+        x_min, y_min, x_max, y_max = box
+        vertex = range_to_search.vertex
+
+        return x_max - vertex.x < 0 or x_min - vertex.x > range_to_search.width \
+            or vertex.y - y_min < 0 or vertex.y - y_max > range_to_search.height
+
+    # the indices of the points inside 'range_to_search' and not inside 'excluded', subtrees covered by 'excluded'
+    # are skipped, so for two overlapping rectangles the cost follows the strips where they differ
+    def search_difference(self, range_to_search, excluded):
+        result = []
+        stack = [self.root]
+
+        while len(stack) > 0:
+            node = stack.pop()
+
+            if node is None or Tree.__misses(node.box, range_to_search) or Tree.__covers(node.box, excluded):
+                continue
+
+            if not node.deleted and range_to_search.contains_point(node.point) \
+                    and not excluded.contains_point(node.point):
+                result.append(node.index)
+
+            goes_left, goes_right = Tree.__sides(range_to_search, node.axis, node.line)
+
+            if goes_right:
+                stack.append(node.right)
+
+            if goes_left:
+                stack.append(node.left)
+
+        return result
+
+    # the same points as 'search', in the order of the chosen strategy; the plan is kept in 'last_plan'
+    def planned_search(self, range_to_search):
+        self.last_plan = self.plan(range_to_search)
+
+        if self.last_plan.strategy == Strategy.TREE:
+            return self.search(range_to_search)
+
+        if self.node_points is None:
+            self.__flatten()
+
+        if self.last_plan.strategy == Strategy.SCAN:
+            found = self.__scan(self.node_points[self.node_alive], range_to_search)
+        else:
+            found = self.__hybrid_search(range_to_search)
+
+        return [self.points[i] for i in found.tolist()]
+
+    def plan(self, range_to_search):
+        count = self.root.summary.count if self.root is not None else 0
+        estimate = self.estimate(range_to_search)
+
+        if estimate <= Tree.TREE_SELECTIVITY * count:
+            strategy = Strategy.TREE
+        elif estimate >= Tree.SCAN_SELECTIVITY * count:
+            strategy = Strategy.SCAN
+        else:
+            strategy = Strategy.HYBRID
+
+        return Plan(strategy, estimate, count)
+
+    # expected number of points inside the rectangle from the counts of the top levels of the tree,
+    # the points of a partly covered node at the last level are taken as spread evenly over its box
+    def estimate(self, range_to_search):
+        estimate = 0.0
+        stack = [(self.root, 0)]
+        low_x, high_x = range_to_search.get_range_by_axis(0)
+        low_y, high_y = range_to_search.get_range_by_axis(1)
+
+        while len(stack) > 0:
+            node, depth = stack.pop()
+
+            if node is None or Tree.__misses(node.box, range_to_search):
+                continue
+
+            if Tree.__covers(node.box, range_to_search):
+                estimate += node.summary.count
+                continue
+
+            x_min, y_min, x_max, y_max = node.box
+
+            if depth == Tree.ESTIMATE_DEPTH:
+                estimate += node.summary.count \
+                    * Tree.__overlap(x_min, x_max, low_x, high_x) * Tree.__overlap(y_min, y_max, low_y, high_y)
+                continue
+
+            if not node.deleted and range_to_search.contains_point(node.point):
+                estimate += 1
+
+            stack.extend([(node.left, depth + 1), (node.right, depth + 1)])
+
+        return estimate
+
+    # part of [low, high] covered by [range_low, range_high]
+    @staticmethod
+    def __overlap(low, high, range_low, range_high):
+        if high <= low:
+            return 1.0
+
+        return max(min(high, range_high) - max(low, range_low), 0.0) / (high - low)
+
+    # the indices of the points inside the rectangle, with the test of Rectangle.contains_point
+    def __scan(self, indices, range_to_search):
+        dx = self.coords[indices, 0] - range_to_search.vertex.x
+        dy = range_to_search.vertex.y - self.coords[indices, 1]
 
-        if range_to_search.contains_point(node.point):
-            output.append(node.point)
+        return indices[(0 <= dx) & (dx <= range_to_search.width) & (0 <= dy) & (dy <= range_to_search.height)]
 
-        if left < node.line:
-            self.__search(node.left, range_to_search, output)
+    # the tree search over the flat nodes, which stops at covered subtrees and at small ones
+    def __hybrid_search(self, range_to_search):
+        found = [numpy.zeros(0, dtype=numpy.int64)]
+        stack = [0] if len(self.node_points) > 0 else []
 
-        if node.line < right:
-            self.__search(node.right, range_to_search, output)
+        while len(stack) > 0:
+            i = stack.pop()
+            box = self.node_boxes[i].tolist()
+
+            if Tree.__misses(box, range_to_search):
+                continue
+
+            subtree = slice(i, i + self.node_sizes[i])
+
+            if Tree.__covers(box, range_to_search):
+                found.append(self.node_points[subtree][self.node_alive[subtree]])
+                continue
+
+            if self.node_sizes[i] <= Tree.HYBRID_SCAN_SIZE:
+                found.append(self.__scan(self.node_points[subtree][self.node_alive[subtree]], range_to_search))
+                continue
+
+            if self.node_alive[i]:
+                found.append(self.__scan(self.node_points[i:i + 1], range_to_search))
+
+            goes_left, goes_right = Tree.__sides(range_to_search, int(self.node_axes[i]), float(self.node_lines[i]))
+
+            if goes_right and self.node_rights[i] != -1:
+                stack.append(self.node_rights[i])
+
+            if goes_left and self.node_lefts[i] != -1:
+                stack.append(self.node_lefts[i])
+
+        return numpy.concatenate(found)
+
+
+# a rectangle moved frame by frame: a move searches only where the new and the old rectangle differ
+# and returns the points that entered and that left it; the tree must not change between moves.
+# the points are kept by their index in the tree, the same point object may be there more than once
+class Viewport:
+    def __init__(self, tree, range_to_search):
+        self.tree = tree
+        self.range_to_search = range_to_search
+        _, indices = tree.search_many([range_to_search])
+        self.points = {index: tree.points[index] for index in indices.tolist()}
+
+    def move(self, range_to_search):
+        entered = self.tree.search_difference(range_to_search, self.range_to_search)
+        left = self.tree.search_difference(self.range_to_search, range_to_search)
+
+        for index in left:
+            del self.points[index]
+
+        for index in entered:
+            self.points[index] = self.tree.points[index]
+
+        self.range_to_search = range_to_search
+
+        return [self.tree.points[index] for index in entered], [self.tree.points[index] for index in left]
+
+    def result(self):
+        return list(self.points.values())
 
 
 class RangeSearcher:
-    def __init__(self, points, range_to_search):
+    def __init__(self, points, range_to_search, engine=Engine.KD_TREE):
         self.points = points
         self.range_to_search = range_to_search
-        self.tree = Tree(points)
+        self.tree = RangeTree(points) if engine == Engine.RANGE_TREE else Tree(points)
         self.result = []
 
+    # a viewport starting at the rectangle, for a view panned frame by frame
+    def viewport(self):
+        if not isinstance(self.tree, Tree):
+            raise ValueError("Viewport queries need the k-d tree engine")
+
+        return Viewport(self.tree, self.range_to_search)
+
     def demo(self):
         self.__plot_input_points()
         self.__plot_rectangles()
@@ -0,0 +1,193 @@
+import multiprocessing
+import numpy
+from multiprocessing import shared_memory
+
+
+# the 2-d tree build done in worker processes: the top levels are split here, then every worker partitions
+# whole subtrees of the shared index array in place and fills in their payload; the order it leaves is the
+# one the serial build leaves and the median of every node sits in its own slot, so slot i of the payload
+# arrays (box, weight total, minimum and maximum, size, axis, slots of the children) belongs to the node
+# of the point order[i]
+class ParallelPartition:
+    TASKS_PER_PROCESS = 4
+
+    # width and type of the shared arrays: coords, weights, order, boxes, summaries, sizes
+    SHARED_ARRAYS = [
+        (2, numpy.float64),
+        (1, numpy.float64),
+        (1, numpy.int64),
+        (4, numpy.float64),
+        (3, numpy.float64),
+        (1, numpy.int64)
+    ]
+
+    # state of a worker process
+    worker_memories = None
+    worker_arrays = None
+
+    def __init__(self, coords, weights, processes=None):
+        self.coords = numpy.ascontiguousarray(coords, dtype=numpy.float64).reshape(-1, 2)
+        self.weights = numpy.ascontiguousarray(weights, dtype=numpy.float64)
+        self.processes = processes if processes is not None else multiprocessing.cpu_count()
+
+        if self.processes < 1:
+            raise ValueError("Processes count must be positive")
+
+    # partitions 'order' in place, returns the boxes, the summaries (total, minimum, maximum), the sizes,
+    # the axes and the left and right children (-1 for none) of the nodes by slot
+    def build(self, order):
+        count = len(order)
+        top_depth = (self.processes * ParallelPartition.TASKS_PER_PROCESS - 1).bit_length()
+
+        # the top levels are cheap to split here and give every worker several subtrees
+        levels = ParallelPartition.split_levels(self.coords, order, 0, count, 0, top_depth)
+        tasks = [
+            (begin, end, top_depth)
+            for begins, ends in levels[-1:]
+            for begin, end in zip(begins.tolist(), ends.tolist())
+        ]
+
+        memories = [
+            shared_memory.SharedMemory(create=True, size=max(count * width * 8, 1))
+            for width, _ in ParallelPartition.SHARED_ARRAYS
+        ]
+
+        try:
+            arrays = ParallelPartition.views(memories, count)
+            arrays[0][:] = self.coords
+            arrays[1][:] = self.weights
+            arrays[2][:] = order
+
+            with multiprocessing.Pool(
+                self.processes,
+                ParallelPartition.attach,
+                ([memory.name for memory in memories], count)
+            ) as pool:
+                pool.starmap(ParallelPartition.build_range, tasks)
+
+            order[:] = arrays[2]
+            boxes, summaries, sizes = [array.copy() for array in arrays[3:]]
+            del arrays
+        finally:
+            for memory in memories:
+                memory.close()
+                memory.unlink()
+
+        # the nodes of the top levels, their children are the roots the workers built
+        for begins, ends in reversed(levels[:-1]):
+            ParallelPartition.fill_level(self.coords, self.weights, order, boxes, summaries, sizes, begins, ends)
+
+        return (boxes, summaries, sizes) + ParallelPartition.shape(count)
+
+    # axes and children of the nodes by slot, they follow from the ranges alone
+    @staticmethod
+    def shape(count):
+        axes = numpy.zeros(count, dtype=numpy.int64)
+        lefts = numpy.full(count, -1, dtype=numpy.int64)
+        rights = numpy.full(count, -1, dtype=numpy.int64)
+        begins = numpy.array([0], dtype=numpy.int64)
+        ends = numpy.array([count], dtype=numpy.int64)
+        depth = 0
+
+        while len(begins) > 0:
+            nonempty = ends > begins
+            begins = begins[nonempty]
+            ends = ends[nonempty]
+            mids = begins + (ends - begins) // 2
+            axes[mids] = depth % 2
+
+            has_left = mids > begins
+            has_right = ends > mids + 1
+            lefts[mids[has_left]] = (begins + (mids - begins) // 2)[has_left]
+            rights[mids[has_right]] = (mids + 1 + (ends - mids - 1) // 2)[has_right]
+
+            begins, ends = numpy.concatenate([begins, mids + 1]), numpy.concatenate([mids, ends])
+            depth += 1
+
+        return axes, lefts, rights
+
+    # splits the nodes level by level from 'depth' down to 'stop_depth' (or to the leaves),
+    # returns (begins, ends) of the nonempty nodes of every level, the last one isn't split
+    @staticmethod
+    def split_levels(coords, order, begin, end, depth, stop_depth=None):
+        levels = []
+        begins = numpy.array([begin], dtype=numpy.int64)
+        ends = numpy.array([end], dtype=numpy.int64)
+
+        while True:
+            nonempty = ends > begins
+            begins = begins[nonempty]
+            ends = ends[nonempty]
+
+            if len(begins) == 0:
+                break
+
+            levels.append((begins, ends))
+
+            if depth == stop_depth:
+                break
+
+            for node_begin, node_end in zip(begins.tolist(), ends.tolist()):
+                ParallelPartition.split(coords, order, node_begin, node_end, depth)
+
+            mids = begins + (ends - begins) // 2
+            begins = numpy.concatenate([begins, mids + 1])
+            ends = numpy.concatenate([mids, ends])
+            depth += 1
+
+        return levels
+
+    # the partition step of one node, the same as the serial build
+    @staticmethod
+    def split(coords, order, begin, end, depth):
+        if end - begin <= 1:
+            return
+
+        view = order[begin:end]
+        mid_idx = len(view) // 2
+        view[:] = view[numpy.argpartition(coords[view, depth % 2], mid_idx)]
+
+    # payload of the nodes of one level from the payload of their children,
+    # with the arithmetic of Tree.__refresh: own point first, then the left and the right child
+    @staticmethod
+    def fill_level(coords, weights, order, boxes, summaries, sizes, begins, ends):
+        mids = begins + (ends - begins) // 2
+        points = order[mids]
+
+        boxes[mids] = numpy.concatenate([coords[points], coords[points]], axis=1)
+        summaries[mids] = weights[points, None]
+        sizes[mids] = 1
+
+        for has_child, children in [
+            (mids > begins, begins + (mids - begins) // 2),
+            (ends > mids + 1, mids + 1 + (ends - mids - 1) // 2)
+        ]:
+            nodes = mids[has_child]
+            children = children[has_child]
+
+            boxes[nodes, :2] = numpy.minimum(boxes[nodes, :2], boxes[children, :2])
+            boxes[nodes, 2:] = numpy.maximum(boxes[nodes, 2:], boxes[children, 2:])
+            summaries[nodes, 0] += summaries[children, 0]
+            summaries[nodes, 1] = numpy.minimum(summaries[nodes, 1], summaries[children, 1])
+            summaries[nodes, 2] = numpy.maximum(summaries[nodes, 2], summaries[children, 2])
+            sizes[nodes] += sizes[children]
+
+    @staticmethod
+    def views(memories, count):
+        return [
+            numpy.ndarray((count, width) if width > 1 else count, dtype=dtype, buffer=memory.buf)
+            for (width, dtype), memory in zip(ParallelPartition.SHARED_ARRAYS, memories)
+        ]
+
+    @staticmethod
+    def attach(names, count):
+        ParallelPartition.worker_memories = [shared_memory.SharedMemory(name=name) for name in names]
+        ParallelPartition.worker_arrays = ParallelPartition.views(ParallelPartition.worker_memories, count)
+
+    # partitions a subtree and fills in the payload of its nodes, the slots of other subtrees aren't touched
+    @staticmethod
+    def build_range(begin, end, depth):
+        coords, weights, order, boxes, summaries, sizes = ParallelPartition.worker_arrays
+
+        for begins, ends in reversed(ParallelPartition.split_levels(coords, order, begin, end, depth)):
+            ParallelPartition.fill_level(coords, weights, order, boxes, summaries, sizes, begins, ends)
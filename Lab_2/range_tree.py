@@ -0,0 +1,80 @@
+import bisect
+import numpy
+
+
+# layered range tree: node j of level l covers the points of x-ranks j * n // 2^l .. (j + 1) * n // 2^l - 1,
+# level l keeps the points of every node sorted by y in the same slots; instead of a y-list per node
+# the levels carry fractional cascading counts, so a query does its two binary searches at the root only
+class RangeTree:
+    def __init__(self, points):
+        self.points = points
+        self.count = len(points)
+        self.depth = max(self.count - 1, 0).bit_length()
+
+        xs = numpy.array([point.x for point in points], dtype=numpy.float64)
+        ys = numpy.array([point.y for point in points], dtype=numpy.float64)
+        by_x = numpy.argsort(xs, kind="stable")
+        ranks = numpy.empty(self.count, dtype=numpy.int64)
+        ranks[by_x] = numpy.arange(self.count)
+
+        self.xs = xs[by_x]
+
+        # level_points[l]: the points of the level in slot order,
+        # lefts[l][i]: how many of the first i slots of level l go to the left children
+        self.level_points = []
+        self.lefts = []
+
+        order = numpy.lexsort((ranks, ys))
+        self.root_ys = ys[order]
+
+        for level in range(self.depth + 1):
+            self.level_points.append(order)
+
+            if level == self.depth:
+                break
+
+            # the children are stable partitions of their parent, so they stay sorted by y
+            slots = numpy.arange(self.count)
+            begins = (numpy.arange(1 << level) * self.count) >> level
+            nodes = numpy.searchsorted(begins, slots, side="right") - 1
+            goes_left = ranks[order] < ((2 * nodes + 1) * self.count) >> (level + 1)
+
+            self.lefts.append(numpy.concatenate([[0], numpy.cumsum(goes_left)]))
+            order = order[numpy.argsort(2 * nodes + ~goes_left, kind="stable")]
+
+    # the same points as Tree.search, the same test as Rectangle.contains_point
+    def search(self, range_to_search):
+        return [self.points[i] for i in self.search_indices(range_to_search)]
+
+    def search_indices(self, range_to_search):
+        vertex = range_to_search.vertex
+
+        # differences of floats are monotone, so the points passing each half of the test are contiguous
+        first_rank = bisect.bisect_left(self.xs, 0, key=lambda x: x - vertex.x)
+        end_rank = bisect.bisect_right(self.xs, range_to_search.width, key=lambda x: x - vertex.x)
+        low = bisect.bisect_left(self.root_ys, -range_to_search.height, key=lambda y: y - vertex.y)
+        high = bisect.bisect_right(self.root_ys, 0, key=lambda y: y - vertex.y)
+
+        found = [numpy.zeros(0, dtype=numpy.int64)]
+        stack = [(0, 0, self.count, low, high)]
+
+        while len(stack) > 0:
+            level, begin, end, low, high = stack.pop()
+
+            if low == high or end <= first_rank or end_rank <= begin:
+                continue
+
+            if first_rank <= begin and end <= end_rank:
+                found.append(self.level_points[level][low:high])
+                continue
+
+            # slots of the node map to the slots of its children through the cascading counts
+            lefts = self.lefts[level]
+            mid = begin + lefts[end] - lefts[begin]
+            left_low = begin + lefts[low] - lefts[begin]
+            left_high = begin + lefts[high] - lefts[begin]
+
+            stack.append((level + 1, mid, end, mid + low - left_low, mid + high - left_high))
+            stack.append((level + 1, begin, mid, left_low, left_high))
+
+        return numpy.concatenate(found)
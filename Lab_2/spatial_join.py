@@ -0,0 +1,154 @@
+import numpy
+from bucket_tree import BucketTree
+
+
+# bucket tree over the centres of the rectangles, its boxes enclose the whole rectangles;
+# the boxes are widened by a few ulps, so that they never cut off a point Rectangle.contains_point accepts
+class RectangleTree:
+    def __init__(self, rectangles, bucket_size=32):
+        vertices = numpy.array([(rectangle.vertex.x, rectangle.vertex.y) for rectangle in rectangles],
+                               dtype=numpy.float64).reshape(-1, 2)
+        sizes = numpy.array([(rectangle.width, rectangle.height) for rectangle in rectangles],
+                            dtype=numpy.float64).reshape(-1, 2)
+
+        # vertex and size of the rectangles as in Rectangle: x, y of the top left corner, width, height
+        lows = numpy.stack([vertices[:, 0], vertices[:, 1] - sizes[:, 1]], axis=1)
+        highs = numpy.stack([vertices[:, 0] + sizes[:, 0], vertices[:, 1]], axis=1)
+
+        self.tree = BucketTree((lows + highs) / 2, bucket_size)
+        self.depth = self.tree.depth
+        self.vertices = vertices[self.tree.permutation]
+        self.sizes = sizes[self.tree.permutation]
+
+        # contains_point rounds the differences to the vertex and compares them with the sizes,
+        # so its error follows the larger of the two and not the bounds, which may be near zero
+        margins = 4 * numpy.spacing(numpy.maximum(numpy.abs(self.vertices), numpy.abs(self.sizes)))
+        lows = lows[self.tree.permutation] - margins
+        highs = highs[self.tree.permutation] + margins
+
+        self.box_min = numpy.full(self.tree.box_min.shape, numpy.inf)
+        self.box_max = numpy.full(self.tree.box_max.shape, -numpy.inf)
+        BucketTree.bucket_boxes(self.box_min, self.box_max, lows, highs, self.tree.count, 0, 0, self.depth)
+        BucketTree.merge_boxes(self.box_min, self.box_max, self.depth)
+
+
+# all (rectangle, point) pairs with the point inside the rectangle: both trees are traversed together,
+# pairs of nodes with disjoint boxes are dropped, the node with the larger box is split first
+class SpatialJoin:
+    CHUNK_SIZE = 1 << 16
+    PAIRS_PER_STEP = 1 << 10
+
+    def __init__(self, points, rectangles, bucket_size=32):
+        coords = numpy.array([(point.x, point.y) for point in points], dtype=numpy.float64).reshape(-1, 2)
+
+        self.points = BucketTree(coords, bucket_size)
+        self.rectangles = RectangleTree(rectangles, bucket_size)
+
+    # yields (rectangle indices, point indices) of at most 'chunk_size' pairs,
+    # the indices are positions in the input lists
+    def pairs(self, chunk_size=CHUNK_SIZE):
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be positive")
+
+        stack = []
+
+        if self.points.count > 0 and self.rectangles.tree.count > 0:
+            stack.append((numpy.zeros(1, dtype=numpy.int64), numpy.zeros(1, dtype=numpy.int64)))
+
+        found_rectangles = []
+        found_points = []
+        found = 0
+
+        # depth first over batches of node pairs, so only a few batches per level are kept
+        while len(stack) > 0:
+            rectangle_nodes, point_nodes = stack.pop()
+
+            if len(rectangle_nodes) > SpatialJoin.PAIRS_PER_STEP:
+                stack.append((rectangle_nodes[SpatialJoin.PAIRS_PER_STEP:], point_nodes[SpatialJoin.PAIRS_PER_STEP:]))
+                rectangle_nodes = rectangle_nodes[:SpatialJoin.PAIRS_PER_STEP]
+                point_nodes = point_nodes[:SpatialJoin.PAIRS_PER_STEP]
+
+            rectangle_nodes, point_nodes, leaves = self.__expand(rectangle_nodes, point_nodes, stack)
+            rectangle_indices, point_indices = self.__join_buckets(rectangle_nodes[leaves], point_nodes[leaves])
+
+            found_rectangles.append(rectangle_indices)
+            found_points.append(point_indices)
+            found += len(rectangle_indices)
+
+            while found >= chunk_size or (found > 0 and len(stack) == 0):
+                rectangle_indices = numpy.concatenate(found_rectangles)
+                point_indices = numpy.concatenate(found_points)
+
+                yield rectangle_indices[:chunk_size], point_indices[:chunk_size]
+
+                found_rectangles = [rectangle_indices[chunk_size:]]
+                found_points = [point_indices[chunk_size:]]
+                found = len(found_rectangles[0])
+
+    # drops the disjoint pairs, pushes the children of the split pairs,
+    # returns the remaining pairs and which of them are pairs of buckets
+    def __expand(self, rectangle_nodes, point_nodes, stack):
+        rectangles = self.rectangles
+        points = self.points
+
+        rectangle_min = rectangles.box_min[rectangle_nodes]
+        rectangle_max = rectangles.box_max[rectangle_nodes]
+        point_min = points.box_min[point_nodes]
+        point_max = points.box_max[point_nodes]
+
+        overlap = (rectangle_min <= point_max).all(axis=1) & (point_min <= rectangle_max).all(axis=1)
+        rectangle_nodes = rectangle_nodes[overlap]
+        point_nodes = point_nodes[overlap]
+
+        rectangle_leaf = SpatialJoin.__level(rectangle_nodes) == rectangles.depth
+        point_leaf = SpatialJoin.__level(point_nodes) == points.depth
+        rectangle_extent = (rectangle_max[overlap] - rectangle_min[overlap]).max(axis=1)
+        point_extent = (point_max[overlap] - point_min[overlap]).max(axis=1)
+
+        split_rectangle = ~rectangle_leaf & (point_leaf | (rectangle_extent >= point_extent))
+        split_point = ~point_leaf & ~split_rectangle
+
+        if split_rectangle.any() or split_point.any():
+            children = [
+                (2 * rectangle_nodes[split_rectangle] + 1, point_nodes[split_rectangle]),
+                (2 * rectangle_nodes[split_rectangle] + 2, point_nodes[split_rectangle]),
+                (rectangle_nodes[split_point], 2 * point_nodes[split_point] + 1),
+                (rectangle_nodes[split_point], 2 * point_nodes[split_point] + 2)
+            ]
+            stack.append(tuple(numpy.concatenate(nodes) for nodes in zip(*children)))
+
+        return rectangle_nodes, point_nodes, rectangle_leaf & point_leaf
+
+    # every rectangle of a bucket against every point of the other bucket, with Rectangle.contains_point
+    def __join_buckets(self, rectangle_leaves, point_leaves):
+        rectangles = self.rectangles
+        points = self.points
+
+        rectangle_begins, rectangle_ends = rectangles.tree.node_range(
+            rectangles.depth, rectangle_leaves - ((1 << rectangles.depth) - 1)
+        )
+        point_begins, point_ends = points.node_range(points.depth, point_leaves - ((1 << points.depth) - 1))
+        rectangle_counts = rectangle_ends - rectangle_begins
+        point_counts = point_ends - point_begins
+
+        pairs = rectangle_counts * point_counts
+        pair = numpy.repeat(numpy.arange(len(pairs)), pairs)
+        within = numpy.arange(pairs.sum()) - numpy.repeat(numpy.cumsum(pairs) - pairs, pairs)
+
+        rectangle_positions = rectangle_begins[pair] + within // point_counts[pair]
+        point_positions = point_begins[pair] + within % point_counts[pair]
+
+        vertices = rectangles.vertices[rectangle_positions]
+        sizes = rectangles.sizes[rectangle_positions]
+        coords = points.points[point_positions]
+        dx = coords[:, 0] - vertices[:, 0]
+        dy = vertices[:, 1] - coords[:, 1]
+        contains = (0 <= dx) & (dx <= sizes[:, 0]) & (0 <= dy) & (dy <= sizes[:, 1])
+
+        return (rectangles.tree.permutation[rectangle_positions[contains]],
+                points.permutation[point_positions[contains]])
+
+    # level of the nodes of an implicit tree
+    @staticmethod
+    def __level(nodes):
+        return numpy.frexp(nodes + 1)[1] - 1
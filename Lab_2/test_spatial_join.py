@@ -0,0 +1,39 @@
+import unittest
+from main import Point, Rectangle
+from spatial_join import SpatialJoin
+
+
+class SpatialJoinTest(unittest.TestCase):
+    # pairs of the join as a set of (rectangle index, point index)
+    @staticmethod
+    def join(points, rectangles, bucket_size):
+        return {
+            (rectangle, point)
+            for rectangle_indices, point_indices in SpatialJoin(points, rectangles, bucket_size).pairs()
+            for rectangle, point in zip(rectangle_indices.tolist(), point_indices.tolist())
+        }
+
+    # the lower side of the first rectangle is at 0, contains_point still accepts the point just below it
+    def test_bound_near_zero(self):
+        points = [Point(0.2, -1e-17)] + [Point(50.0 + i, 50.0 + i) for i in range(7)]
+        rectangles = [Rectangle(Point(0.1, 0.3), 0.3, 0.2)] + [Rectangle(Point(60.0, 60.0), 1.0, 1.0)] * 3
+
+        self.assertTrue(rectangles[0].contains_point(points[0]))
+        self.assertEqual(SpatialJoinTest.join(points, rectangles, 1), {(0, 0)})
+
+    def test_brute_force(self):
+        points = [Point(i % 13 / 4, i % 7 / 3) for i in range(200)]
+        rectangles = [Rectangle(Point(i % 5 / 2, i % 9 / 4), i % 4 / 3, i % 3 / 2) for i in range(50)]
+        expected = {
+            (i, j)
+            for i, rectangle in enumerate(rectangles)
+            for j, point in enumerate(points)
+            if rectangle.contains_point(point)
+        }
+
+        for bucket_size in [1, 4, 32]:
+            self.assertEqual(SpatialJoinTest.join(points, rectangles, bucket_size), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()